@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -95,6 +96,37 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# Every uwsgi and worker process must see the same cache, so backends
+# local to a process are refused by a system check, see core.checks; tests
+# use a local memory cache instead, see app.test_runner
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.memcached.PyMemcacheCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', '127.0.0.1:11211'),
+    }
+}
+
+TEST_RUNNER = 'app.test_runner.TestRunner'
+
+# Token authentication cache, which must be shared between processes.
+# Entries in the per-process LRU may outlive an invalidation made by
+# another process for up to the local TTL.
+TOKEN_CACHE_ALIAS = 'default'
+TOKEN_CACHE_TIMEOUT = int(os.environ.get('TOKEN_CACHE_TIMEOUT', 300))
+TOKEN_CACHE_LOCAL_TTL = int(os.environ.get('TOKEN_CACHE_LOCAL_TTL', 5))
+TOKEN_CACHE_LOCAL_SIZE = int(os.environ.get('TOKEN_CACHE_LOCAL_SIZE', 1024))
+
+# Per-user versioned cache of recipe, tag and ingredient read responses
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 600))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -137,6 +169,13 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# Have nginx send media files checked by views, with an X-Accel-Redirect
+# to its internal location at MEDIA_ACCEL_PREFIX; runserver under DEBUG
+# has no proxy, so views stream the files there instead
+MEDIA_ACCEL_REDIRECT = bool(
+    int(os.environ.get('MEDIA_ACCEL_REDIRECT', int(not DEBUG))))
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/internal-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -146,8 +185,79 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'recipe.pagination.KeysetPagination',
+    # JSON is encoded and decoded with orjson, see core.renderers
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'PAGE_SIZE': int(os.environ.get('PAGE_SIZE', 100)),
 }
 
+# Upper bound for the page_size query parameter on paginated lists
+RECIPE_MAX_PAGE_SIZE = int(os.environ.get('RECIPE_MAX_PAGE_SIZE', 500))
+
+# Maximum number of recipes accepted by one bulk create request
+RECIPE_BULK_MAX_SIZE = int(os.environ.get('RECIPE_BULK_MAX_SIZE', 1000))
+
+# Number of recipes read and serialized at a time by the streaming export
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 500))
+
+# Text search configuration used to build and query recipe search vectors;
+# changing it requires recomputing the stored vectors
+RECIPE_SEARCH_CONFIG = os.environ.get('RECIPE_SEARCH_CONFIG', 'english')
+
+# Default and maximum number of tag/ingredient autocomplete suggestions
+RECIPE_AUTOCOMPLETE_LIMIT = int(os.environ.get('RECIPE_AUTOCOMPLETE_LIMIT', 10))
+RECIPE_AUTOCOMPLETE_MAX_LIMIT = int(
+    os.environ.get('RECIPE_AUTOCOMPLETE_MAX_LIMIT', 50))
+
+# Longest edge in pixels of each resized copy made of uploaded recipe images
+RECIPE_IMAGE_RENDITIONS = {
+    'thumb': 160,
+    'medium': 640,
+    'large': 1280,
+}
+
+# Encoder quality (1-100) of recipe image renditions
+RECIPE_IMAGE_QUALITY = int(os.environ.get('RECIPE_IMAGE_QUALITY', 80))
+
+# Render image renditions in a background job instead of during the upload
+RECIPE_IMAGE_RENDITIONS_ASYNC = bool(
+    int(os.environ.get('RECIPE_IMAGE_RENDITIONS_ASYNC', 1)))
+
+# Largest recipe image upload accepted in bytes, matching the proxy's
+# client_max_body_size, and most pixels an uploaded image may declare,
+# so that decoding it cannot exhaust memory
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(
+    os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 50_000_000))
+
+# Store recipe images under a digest of their content, so identical files
+# are kept once; read when models are loaded, see core.storage
+RECIPE_IMAGE_CONTENT_ADDRESSED = bool(
+    int(os.environ.get('RECIPE_IMAGE_CONTENT_ADDRESSED', 1)))
+
+# Seconds an image file is kept after it was last stored, even once no
+# recipe uses it, so an identical upload still in flight can reuse it
+RECIPE_IMAGE_DELETE_DELAY = int(
+    os.environ.get('RECIPE_IMAGE_DELETE_DELAY', 3600))
+
+# Background jobs: attempts before a job is marked failed, seconds before
+# the first retry (doubled for each later one), seconds after which a
+# running job is presumed abandoned by its worker, and seconds an idle
+# worker waits before looking for jobs again
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))
+JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 600))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True
 }
@@ -0,0 +1,34 @@
+"""
+Test runner for the project.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class TestRunner(DiscoverRunner):
+    """Run tests with a local memory cache.
+
+    Test databases reuse primary keys, so cached entries of users and
+    tokens must not be shared with other test runs or with the app.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(
+            CACHES=TEST_CACHES,
+            SILENCED_SYSTEM_CHECKS=settings.SILENCED_SYSTEM_CHECKS + [
+                'core.E001'],
+        )
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
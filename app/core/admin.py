@@ -33,3 +33,16 @@ admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Recipe)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
+admin.site.register(models.StoredFile)
+
+
+class JobAdmin(admin.ModelAdmin):
+    """Define the admin pages for background jobs"""
+    ordering = ['-id']
+    list_display = ['id', 'name', 'status', 'attempts', 'user', 'created_at',
+                    'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+admin.site.register(models.Job, JobAdmin)
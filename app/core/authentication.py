@@ -0,0 +1,95 @@
+"""
+Authentication for the API.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class LRUCache:
+    """Bounded in-process cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value for a key, or None if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove a key if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+
+local_tokens = LRUCache(
+    settings.TOKEN_CACHE_LOCAL_SIZE, settings.TOKEN_CACHE_LOCAL_TTL)
+
+
+def _cache_key(key):
+    return f'auth-token:{key}'
+
+
+def invalidate_token(key):
+    """Forget the cached user for a token."""
+    local_tokens.delete(key)
+    caches[settings.TOKEN_CACHE_ALIAS].delete(_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the token to user lookup.
+
+    Tokens are kept in a small in-process LRU in front of Django's cache
+    framework, so most requests resolve their user without a query.
+    """
+
+    def authenticate_credentials(self, key):
+        data = local_tokens.get(key)
+        if data is None:
+            cache = caches[settings.TOKEN_CACHE_ALIAS]
+            data = cache.get(_cache_key(key))
+            if data is None:
+                user, token = super().authenticate_credentials(key)
+                data = pickle.dumps(token)
+                cache.set(_cache_key(key), data, settings.TOKEN_CACHE_TIMEOUT)
+            local_tokens.set(key, data)
+
+        token = pickle.loads(data)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+
+        return (token.user, token)
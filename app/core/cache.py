@@ -0,0 +1,139 @@
+"""
+Per-user versioned response cache for the API.
+
+Every cached response key embeds a version number stored per user. Any
+write bumps the version, so all of a user's cached responses become
+unreachable at once and expire on their own.
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+
+HITS_KEY = 'resp-cache:hits'
+MISSES_KEY = 'resp-cache:misses'
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'resp-version:{user_id}'
+
+
+def _modified_key(user_id):
+    return f'resp-modified:{user_id}'
+
+
+def _incr(key, initial):
+    # increment a counter, creating it with an initial value if missing
+    cache = _cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial, None)
+        return cache.get(key)
+
+
+def get_user_version(user):
+    """Return the current response cache version for a user."""
+    cache = _cache()
+    version = cache.get(_version_key(user.pk))
+    if version is None:
+        # start from the clock so a lost counter never reuses old keys
+        cache.add(_version_key(user.pk), time.time_ns(), None)
+        version = cache.get(_version_key(user.pk))
+    return version
+
+
+def get_user_modified(user):
+    """Return the timestamp of the last write by a user."""
+    cache = _cache()
+    modified = cache.get(_modified_key(user.pk))
+    if modified is None:
+        # assume a write just happened when the timestamp was lost
+        cache.add(_modified_key(user.pk), time.time(), None)
+        modified = cache.get(_modified_key(user.pk))
+    return modified
+
+
+def _bump(user_id):
+    _incr(_version_key(user_id), time.time_ns())
+    _cache().set(_modified_key(user_id), time.time(), None)
+
+
+def bump_user_version(user):
+    """Invalidate every cached response for a user.
+
+    Inside a transaction the version is bumped again once it commits, as
+    a read made before then may have cached the uncommitted state under
+    the first new version.
+    """
+    _bump(user.pk)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(partial(_bump, user.pk))
+
+
+def reset_user_version(user):
+    """Start a fresh version for a new user."""
+    _cache().set(_version_key(user.pk), time.time_ns(), None)
+
+
+def cache_stats():
+    """Return the response cache hit and miss counters."""
+    cache = _cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+class VersionedCacheMixin:
+    """Cache successful read responses for the requesting user."""
+
+    def response_cache_key(self, request, validator=None):
+        """Return the key for a request, normalizing its query params.
+
+        A validator, such as the ETag sent with the response, is part of
+        the key, so a cached body is only served with the validator it was
+        built for.
+        """
+        params = sorted(
+            (name, value)
+            for name in request.query_params
+            for value in request.query_params.getlist(name)
+        )
+        route = (self.basename, self.action, sorted(self.kwargs.items()))
+        digest = hashlib.sha1(
+            repr((route, params, validator)).encode()).hexdigest()
+        version = get_user_version(request.user)
+        return f'resp:{request.user.pk}:{version}:{digest}'
+
+    def cached_response(self, handler, request, *args, validator=None,
+                        **kwargs):
+        """Return a cached response or call the handler and cache it."""
+        cache = _cache()
+        key = self.response_cache_key(request, validator)
+        data = cache.get(key)
+        if data is not None:
+            _incr(HITS_KEY, 1)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _incr(MISSES_KEY, 1)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
@@ -0,0 +1,36 @@
+"""
+System checks for the core app.
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+# cache backends whose entries are only seen by the process storing them
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+# settings naming caches that every app and worker process must share
+SHARED_CACHE_SETTINGS = (
+    'TOKEN_CACHE_ALIAS',
+    'RESPONSE_CACHE_ALIAS',
+)
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    """Refuse process-local backends for caches shared by processes."""
+    errors = []
+    for name in SHARED_CACHE_SETTINGS:
+        alias = getattr(settings, name)
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(Error(
+                f"The '{alias}' cache used by {name} is local to each "
+                'process.',
+                hint='Invalidations made by one uwsgi or worker process '
+                     'would not reach the others. Set CACHE_BACKEND and '
+                     'CACHE_LOCATION to a shared cache such as memcached.',
+                id='core.E001',
+            ))
+    return errors
@@ -0,0 +1,89 @@
+"""
+Resized renditions of uploaded recipe images.
+
+Each rendition is bounded to a longest edge from RECIPE_IMAGE_RENDITIONS,
+rotated upright from its EXIF orientation and saved without metadata, in
+every format of RENDITION_FORMATS, next to the original file.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+# Pillow format and file extension of each rendition format
+RENDITION_FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'jpeg': ('JPEG', '.jpg'),
+}
+
+
+def rendition_name(name, size, fmt):
+    """Return the storage name of a rendition of an image file."""
+    root, _ = os.path.splitext(name)
+    return f'{root}.{size}{RENDITION_FORMATS[fmt][1]}'
+
+
+def _open(file, max_edge):
+    # decode an upright image, letting JPEG decoders downscale for free
+    image = Image.open(file)
+    image.draft('RGB', (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (
+        'transparency' in image.info)
+    mode = 'RGBA' if has_alpha else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
+
+
+def _encode(image, fmt):
+    # encode an image without metadata
+    buffer = io.BytesIO()
+    quality = settings.RECIPE_IMAGE_QUALITY
+    if fmt == 'jpeg':
+        if image.mode == 'RGBA':
+            # JPEG has no alpha channel, so flatten onto white
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.save(buffer, 'JPEG', quality=quality, optimize=True,
+                   progressive=True)
+    else:
+        image.save(buffer, RENDITION_FORMATS[fmt][0], quality=quality)
+    return buffer.getvalue()
+
+
+def create_renditions(image_file):
+    """Save resized copies of an image file and return their description.
+
+    Returns a mapping of size name to width, height and the storage name
+    of each format. Sizes are made largest first, each resized from the
+    previous one, so the original is decoded and resampled only once.
+    """
+    sizes = sorted(
+        settings.RECIPE_IMAGE_RENDITIONS.items(), key=lambda item: -item[1])
+    with image_file.open('rb'):
+        image = _open(image_file, sizes[0][1])
+
+    renditions = {}
+    for size, max_edge in sizes:
+        # never upscales, so small originals keep their size
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        rendition = {'width': image.width, 'height': image.height}
+        for fmt in RENDITION_FORMATS:
+            rendition[fmt] = image_file.storage.save(
+                rendition_name(image_file.name, size, fmt),
+                ContentFile(_encode(image, fmt)),
+            )
+        renditions[size] = rendition
+    return renditions
+
+
+def render_recipe_image(recipe):
+    """Create the renditions of a recipe image and save them on the recipe."""
+    recipe.image_renditions = (
+        create_renditions(recipe.image) if recipe.image else {})
+    recipe.save(update_fields=['image_renditions', 'updated_at'])
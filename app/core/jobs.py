@@ -0,0 +1,150 @@
+"""
+Background jobs queued in the database.
+
+Jobs are rows of core.models.Job. Workers started by the run_workers
+command claim them with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+of workers can share the queue without a broker and without waiting on
+each other. Job functions are registered with the job decorator in a
+jobs module of any installed app and receive the job payload as keyword
+arguments; whatever mapping they return is stored as the job result.
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.cache import bump_user_version
+from core.images import render_recipe_image as render_image
+from core.models import Job, Recipe
+
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(func):
+    """Register a function as a job named after it."""
+    if registry.setdefault(func.__name__, func) is not func:
+        raise ValueError(f'A job named {func.__name__} already exists')
+    return func
+
+
+def autodiscover():
+    """Import the jobs module of every installed app."""
+    autodiscover_modules('jobs')
+
+
+def enqueue(name, user=None, **payload):
+    """Queue a registered job and return it."""
+    if name not in registry:
+        raise ValueError(f'Unknown job {name}')
+    return Job.objects.create(name=name, user=user, payload=payload)
+
+
+def claim():
+    """Mark the next runnable job as running and return it, or None.
+
+    Jobs left running for longer than JOB_TIMEOUT are presumed abandoned
+    by a dead worker and claimed again, unless they used up their
+    attempts: those are marked failed, as they may be what killed it.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_TIMEOUT)
+    abandoned = Job.objects.filter(status=Job.RUNNING, started_at__lt=stale)
+    runnable = (
+        Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+        .order_by('run_after', 'id'),
+        abandoned.filter(attempts__lt=settings.JOB_MAX_ATTEMPTS)
+        .order_by('started_at'),
+    )
+    with transaction.atomic():
+        abandoned.filter(attempts__gte=settings.JOB_MAX_ATTEMPTS).update(
+            status=Job.FAILED, finished_at=now,
+            error='Abandoned by its worker on every attempt.')
+        for queryset in runnable:
+            claimed = queryset.select_for_update(skip_locked=True).first()
+            if claimed is not None:
+                claimed.status = Job.RUNNING
+                claimed.attempts += 1
+                claimed.started_at = now
+                claimed.save(
+                    update_fields=['status', 'attempts', 'started_at'])
+                return claimed
+    return None
+
+
+def run(claimed):
+    """Run a claimed job and record its outcome, retrying failures."""
+    try:
+        result = registry[claimed.name](**claimed.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed', claimed.pk, claimed.name)
+        claimed.error = traceback.format_exc()
+        if claimed.attempts < settings.JOB_MAX_ATTEMPTS:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (claimed.attempts - 1)
+            claimed.status = Job.PENDING
+            claimed.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            claimed.status = Job.FAILED
+    else:
+        claimed.status = Job.DONE
+        claimed.result = result or {}
+        claimed.error = ''
+    claimed.finished_at = timezone.now()
+    claimed.save(update_fields=[
+        'status', 'result', 'error', 'run_after', 'finished_at'])
+
+
+def run_next():
+    """Claim and run one job, returning it, or None if none is runnable."""
+    claimed = claim()
+    if claimed is not None:
+        run(claimed)
+    return claimed
+
+
+def work(once=False):
+    """Run jobs until stopped, or until none is runnable when once is set.
+
+    Returns the number of jobs run.
+    """
+    count = 0
+    while True:
+        # drop connections that broke or outlived CONN_MAX_AGE
+        close_old_connections()
+        if run_next() is not None:
+            count += 1
+        elif once:
+            return count
+        else:
+            time.sleep(settings.JOB_POLL_INTERVAL)
+
+
+@job
+def render_recipe_image(recipe_id, image):
+    """Create the renditions of a recipe image, unless it was replaced."""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or recipe.image.name != image:
+        return {'skipped': True}
+    render_image(recipe)
+    bump_user_version(recipe.user)
+    return {'renditions': list(recipe.image_renditions)}
+
+
+@job
+def repair_counters():
+    """Recount the recipes of every tag and ingredient."""
+    call_command('repair_counters')
+
+
+@job
+def gc_media():
+    """Delete media files that nothing references."""
+    call_command('gc_media')
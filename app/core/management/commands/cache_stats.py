@@ -0,0 +1,20 @@
+"""
+Django command to report response cache hit and miss counters.
+"""
+from django.core.management.base import BaseCommand
+
+from core.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show response cache hit and miss counters.'
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        stats = cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'hits={stats["hits"]} misses={stats["misses"]} '
+            f'hit_ratio={ratio:.2%}'
+        )
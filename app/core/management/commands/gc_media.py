@@ -0,0 +1,126 @@
+"""
+Django command to delete media files that nothing references.
+"""
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.jobs import enqueue
+from core.models import Job, Recipe, StoredFile, recipe_file_names
+
+
+def _key(name):
+    # 8 byte digest of a name; a collision can only keep an orphan
+    return int.from_bytes(
+        hashlib.blake2b(name.encode(), digest_size=8).digest(), 'big')
+
+
+def _walk(root):
+    # yield the entries of files below a directory, one directory at a time
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+class Command(BaseCommand):
+    help = 'Delete files under MEDIA_ROOT that no recipe or job references.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report orphaned files without deleting them')
+        parser.add_argument(
+            '--min-age', type=int, default=settings.RECIPE_IMAGE_DELETE_DELAY,
+            help='Keep files modified within this many seconds, as uploads '
+                 'in progress are not referenced yet')
+        parser.add_argument(
+            '--rate', type=float, default=100,
+            help='Most files deleted per second, 0 for no limit')
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Number of references loaded per query')
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Queue the collection for run_workers instead of running it')
+
+    def _referenced(self, batch_size):
+        # return the keys of every file name recipes and jobs refer to
+        referenced = set()
+        recipes = Recipe.objects.filter(
+            Q(image__gt='') | ~Q(image_renditions={}),
+        ).values_list('image', 'image_renditions')
+        for image, renditions in recipes.iterator(chunk_size=batch_size):
+            referenced.update(map(_key, recipe_file_names(image, renditions)))
+        # counted files too, should the counters be ahead of recipes
+        stored = StoredFile.objects.filter(refs__gt=0).values_list(
+            'name', flat=True)
+        referenced.update(map(_key, stored.iterator(chunk_size=batch_size)))
+        # files written by jobs, such as exports
+        results = Job.objects.filter(result__has_key='file').values_list(
+            'result', flat=True)
+        for result in results.iterator(chunk_size=batch_size):
+            referenced.add(_key(result['file']))
+        return referenced
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['background']:
+            job = enqueue('gc_media')
+            self.stdout.write(f'Queued job {job.pk}')
+            return
+
+        # files stored after this point are newer than the references
+        kept_after = time.time() - options['min_age']
+        referenced = self._referenced(options['batch_size'])
+        root = settings.MEDIA_ROOT
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        scanned = orphans = size = 0
+        deleted_names = []
+        next_delete = time.monotonic()
+        for entry in _walk(root):
+            scanned += 1
+            name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+            if _key(name) in referenced:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > kept_after:
+                continue
+            orphans += 1
+            size += stat.st_size
+            if options['verbosity'] > 1:
+                self.stdout.write(name)
+            if options['dry_run']:
+                continue
+            # spread unlinks out to leave I/O for serving requests
+            delay = next_delete - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_delete = max(next_delete, time.monotonic()) + interval
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            deleted_names.append(name)
+            if len(deleted_names) >= options['batch_size']:
+                StoredFile.objects.filter(
+                    name__in=deleted_names, refs=0).delete()
+                deleted_names = []
+        StoredFile.objects.filter(name__in=deleted_names, refs=0).delete()
+
+        verb = 'Found' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {orphans} orphaned files ({size / 1e6:.1f}MB) '
+            f'of {scanned} scanned'))
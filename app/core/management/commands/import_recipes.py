@@ -0,0 +1,223 @@
+"""
+Django command to bulk import recipes from a newline-delimited JSON file.
+"""
+import csv
+import hashlib
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import Now
+
+from core.cache import bump_user_version
+from core.models import Recipe, Tag, Ingredient
+
+
+STAGING_TABLES = {
+    'import_recipe': (
+        'external_id varchar(64) NOT NULL, '
+        'title varchar(255) NOT NULL, '
+        'description text, '
+        'time_minutes integer NOT NULL, '
+        'price numeric(5, 2) NOT NULL, '
+        'link varchar(255)'
+    ),
+    'import_tag': 'external_id varchar(64) NOT NULL, name varchar(255) NOT NULL',
+    'import_ingredient': (
+        'external_id varchar(64) NOT NULL, name varchar(255) NOT NULL'
+    ),
+}
+
+MERGE_RECIPES_SQL = """
+    INSERT INTO {recipe} (
+        user_id, external_id, title, description, time_minutes, price, link,
+        updated_at, image_renditions
+    )
+    SELECT DISTINCT ON (s.external_id)
+        %(user)s, s.external_id, s.title, COALESCE(s.description, ''),
+        s.time_minutes, s.price, COALESCE(s.link, ''), now(), '{{}}'
+    FROM import_recipe s
+    ORDER BY s.external_id
+    ON CONFLICT DO NOTHING
+"""
+
+MERGE_ATTRS_SQL = """
+    INSERT INTO {attr} (user_id, name, recipe_count)
+    SELECT DISTINCT %(user)s, s.name, 0
+    FROM {staging} s
+    ON CONFLICT (user_id, name) DO NOTHING
+"""
+
+MERGE_THROUGH_SQL = """
+    WITH added AS (
+        INSERT INTO {through} ({source}, {target})
+        SELECT DISTINCT r.id, a.id
+        FROM {staging} s
+        JOIN {recipe} r
+            ON r.user_id = %(user)s AND r.external_id = s.external_id
+        JOIN {attr} a ON a.user_id = %(user)s AND a.name = s.name
+        ON CONFLICT DO NOTHING
+        RETURNING {source}, {target}
+    ), touched AS (
+        UPDATE {recipe} SET updated_at = now()
+        WHERE id IN (SELECT {source} FROM added)
+    )
+    UPDATE {attr} SET recipe_count = {attr}.recipe_count + c.total
+    FROM (
+        SELECT {target}, count(*) AS total FROM added GROUP BY {target}
+    ) c
+    WHERE {attr}.id = c.{target}
+"""
+
+
+def _limited(model, field, value):
+    # return a value, refusing one longer than its column before COPY does
+    max_length = model._meta.get_field(field).max_length
+    if value is not None and len(str(value)) > max_length:
+        raise ValueError(
+            f'{model._meta.model_name} {field} is longer than '
+            f'{max_length} characters')
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Import recipes, tags and ingredients for a user from NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='NDJSON file with one recipe per line, or - for stdin')
+        parser.add_argument(
+            '--user', required=True, help='Email of the owning user')
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Number of lines copied into staging tables at a time')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist')
+
+        start = time.monotonic()
+        if options['path'] == '-':
+            total = self._import(user, sys.stdin, options['batch_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as source:
+                total = self._import(user, source, options['batch_size'])
+        elapsed = max(time.monotonic() - start, 1e-6)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} recipes in {elapsed:.1f}s '
+            f'({total / elapsed:.0f} rows/s)'
+        ))
+
+    def _import(self, user, source, batch_size):
+        # copy the file into staging tables and merge them in one transaction
+        total = 0
+        start = time.monotonic()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table, columns in STAGING_TABLES.items():
+                cursor.execute(f'DROP TABLE IF EXISTS pg_temp.{table}')
+                cursor.execute(
+                    f'CREATE TEMPORARY TABLE {table} ({columns}) '
+                    'ON COMMIT DROP')
+
+            buffers = self._new_buffers()
+            for line_no, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                self._stage(buffers, line, line_no)
+                total += 1
+                if total % batch_size == 0:
+                    self._copy(cursor, buffers)
+                    buffers = self._new_buffers()
+                    rate = total / max(time.monotonic() - start, 1e-6)
+                    self.stdout.write(
+                        f'Staged {total} recipes ({rate:.0f} rows/s)')
+            self._copy(cursor, buffers)
+
+            self._merge(cursor, user)
+
+        bump_user_version(user)
+        return total
+
+    def _new_buffers(self):
+        # return an in-memory CSV buffer and writer for each staging table
+        buffers = {}
+        for table in STAGING_TABLES:
+            buffer = io.StringIO()
+            buffers[table] = (
+                buffer, csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC))
+        return buffers
+
+    def _stage(self, buffers, line, line_no):
+        # validate one line and append its rows to the staging buffers
+        try:
+            data = json.loads(line)
+            if not str(data['title']).strip():
+                raise ValueError('title may not be blank')
+            external_id = _limited(
+                Recipe, 'external_id', str(
+                    data.get('external_id') or hashlib.sha256(
+                        line.strip().encode('utf-8')).hexdigest()))
+            recipe_row = [
+                external_id,
+                _limited(Recipe, 'title', data['title']),
+                data.get('description'),
+                int(data['time_minutes']),
+                Decimal(str(data['price'])),
+                _limited(Recipe, 'link', data.get('link')),
+            ]
+            tag_rows = [
+                [external_id, _limited(Tag, 'name', tag['name'])]
+                for tag in data.get('tags', [])
+            ]
+            ingredient_rows = [
+                [external_id, _limited(Ingredient, 'name', ingredient['name'])]
+                for ingredient in data.get('ingredients', [])
+            ]
+        except (ValueError, KeyError, TypeError, InvalidOperation) as exc:
+            raise CommandError(f'Invalid recipe on line {line_no}: {exc!r}')
+
+        buffers['import_recipe'][1].writerow(recipe_row)
+        buffers['import_tag'][1].writerows(tag_rows)
+        buffers['import_ingredient'][1].writerows(ingredient_rows)
+
+    def _copy(self, cursor, buffers):
+        # stream the buffered rows into the staging tables with COPY
+        for table, (buffer, writer) in buffers.items():
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY {table} FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def _merge(self, cursor, user):
+        # merge staged rows into the real tables with set-based inserts
+        params = {'user': user.pk}
+        recipe = Recipe._meta.db_table
+        cursor.execute(MERGE_RECIPES_SQL.format(recipe=recipe), params)
+
+        for staging, model, related in (
+            ('import_tag', Tag, Recipe.tags),
+            ('import_ingredient', Ingredient, Recipe.ingredients),
+        ):
+            attr = model._meta.db_table
+            cursor.execute(
+                MERGE_ATTRS_SQL.format(attr=attr, staging=staging), params)
+            cursor.execute(MERGE_THROUGH_SQL.format(
+                through=related.through._meta.db_table,
+                source=related.field.m2m_column_name(),
+                target=related.field.m2m_reverse_name(),
+                staging=staging,
+                recipe=recipe,
+                attr=attr,
+            ), params)
+
+        # every recipe written above was stamped with the transaction time
+        Recipe.objects.filter(
+            user=user, updated_at=Now()).update_search_vector()
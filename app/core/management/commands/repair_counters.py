@@ -0,0 +1,93 @@
+"""
+Django command to recount the recipes using each tag, ingredient and
+stored image file.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from core.cache import bump_user_version
+from core.jobs import enqueue
+from core.models import (
+    Ingredient,
+    Recipe,
+    StoredFile,
+    Tag,
+    recipe_file_names,
+)
+
+
+class Command(BaseCommand):
+    help = ('Fix recipe counters of tags, ingredients and stored files '
+            'that have drifted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drifted counters without fixing them')
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Queue the repair for run_workers instead of running it')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['background']:
+            job = enqueue('repair_counters')
+            self.stdout.write(f'Queued job {job.pk}')
+            return
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        user_ids = set()
+        for model in (Tag, Ingredient):
+            with transaction.atomic():
+                # lock drifted rows so concurrent changes wait for the fix
+                drifted = list(
+                    model.objects.select_for_update().with_recipe_total()
+                    .exclude(recipe_count=F('recipe_total'))
+                    .values_list('user_id', 'pk'))
+                if not options['dry_run']:
+                    model.objects.filter(
+                        pk__in=[pk for _, pk in drifted],
+                    ).refresh_recipe_count()
+            user_ids.update(user_id for user_id, _ in drifted)
+            self.stdout.write(
+                f'{verb} {len(drifted)} drifted '
+                f'{model._meta.verbose_name} counters')
+
+        drifted = self._repair_stored_files(options['dry_run'])
+        self.stdout.write(
+            f'{verb} {len(drifted)} drifted '
+            f'{StoredFile._meta.verbose_name} counters')
+
+        if not options['dry_run']:
+            # cached responses may have been built from the wrong counts
+            for user in get_user_model().objects.filter(pk__in=user_ids):
+                bump_user_version(user)
+
+    def _repair_stored_files(self, dry_run):
+        # recount the recipes using each stored file, returning the drifted
+        # counts by name
+        with transaction.atomic():
+            # lock the counters so concurrent changes wait for the fix
+            counted = dict(StoredFile.objects.select_for_update().values_list(
+                'name', 'refs'))
+            refs = Counter()
+            for image, renditions in Recipe.objects.filter(
+                Q(image__gt='') | ~Q(image_renditions={}),
+            ).values_list('image', 'image_renditions').iterator():
+                refs.update(recipe_file_names(image, renditions))
+            drifted = {
+                name: refs[name] for name in counted.keys() | refs.keys()
+                if counted.get(name) != refs[name]
+            }
+            if not dry_run:
+                for name, count in drifted.items():
+                    StoredFile.objects.update_or_create(
+                        name=name, defaults={'refs': count})
+                unused = [name for name, count in drifted.items() if not count]
+                transaction.on_commit(
+                    lambda: StoredFile.objects.delete_unused(unused))
+        return drifted
@@ -0,0 +1,42 @@
+"""
+Django command to run background jobs in a pool of worker processes.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.jobs import work
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs with one worker process per core.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes, defaults to the CPU count')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is left to run instead of waiting')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        workers = max(options['workers'], 1)
+        self.stdout.write(f'Running jobs with {workers} workers')
+        if workers == 1:
+            count = work(options['once'])
+        else:
+            # each worker must open its own database connection
+            connections.close_all()
+            with ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('fork'),
+            ) as pool:
+                futures = [
+                    pool.submit(work, options['once'])
+                    for _ in range(workers)
+                ]
+                count = sum(future.result() for future in futures)
+        self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs'))
@@ -0,0 +1,82 @@
+"""
+Delivery of stored media files.
+
+Views check access in Django, then answer with an X-Accel-Redirect to an
+internal nginx location that sends the file itself, so Python workers
+never stream file contents. Without the proxy, as under runserver, the
+file is streamed instead.
+
+Uploaded files are never served publicly. Responses are always private:
+a URL naming the file version, see media_version, may be kept as
+immutable, any other is revalidated with its ETag.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from core.storage import ContentAddressedStorage
+
+
+# stored files are never rewritten, so a URL naming one may be kept a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def media_version(name):
+    """Return the version of a stored file named in URLs sending it.
+
+    Stored names are never reused for other content: content-addressed
+    names hold the digest of the file, others a random UUID.
+    """
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def media_etag(storage, name):
+    """Return a strong ETag for a stored file, or raise FileNotFoundError.
+
+    Content-addressed files are tagged with their digest, other files with
+    their modification time and size.
+    """
+    size = storage.size(name)
+    if isinstance(storage, ContentAddressedStorage):
+        return f'"{media_version(name)}"'
+    modified = storage.get_modified_time(name).timestamp()
+    return f'"{int(modified):x}-{size:x}"'
+
+
+def media_response(request, storage, name, filename=None, immutable=False):
+    """Return a response sending a stored file, or raise Http404.
+
+    The file is sent as an attachment when a download filename is given.
+    Only immutable responses may be kept by clients without revalidation.
+    """
+    try:
+        etag = media_etag(storage, name)
+    except FileNotFoundError:
+        raise Http404
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        content_type = (
+            mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        if settings.MEDIA_ACCEL_REDIRECT:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = quote(
+                settings.MEDIA_ACCEL_PREFIX + name)
+        else:
+            response = FileResponse(
+                storage.open(name), content_type=content_type)
+        if filename:
+            response['Content-Disposition'] = (
+                f'attachment; filename="{filename}"')
+
+    response['ETag'] = etag
+    if immutable:
+        patch_cache_control(
+            response, private=True, max_age=IMMUTABLE_MAX_AGE,
+            immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
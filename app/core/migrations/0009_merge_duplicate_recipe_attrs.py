@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Keep the oldest tag/ingredient per user and name and repoint recipes."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, related in (
+        ('Tag', Recipe.tags),
+        ('Ingredient', Recipe.ingredients),
+    ):
+        model = apps.get_model('core', model_name)
+        through = related.through
+        source = related.field.m2m_field_name()
+        target = related.field.m2m_reverse_field_name()
+        groups = model.objects.values('user', 'name').annotate(
+            keep=Min('id'), total=Count('id')).filter(total__gt=1)
+
+        for group in groups:
+            duplicates = list(model.objects.filter(
+                user=group['user'], name=group['name'],
+            ).exclude(id=group['keep']).values_list('id', flat=True))
+            for duplicate in duplicates:
+                # drop links the kept object already has, then move the rest
+                linked = through.objects.filter(
+                    **{target: group['keep']}).values(source)
+                rows = through.objects.filter(**{target: duplicate})
+                rows.filter(**{f'{source}__in': linked}).delete()
+                rows.update(**{target: group['keep']})
+            model.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import migrations, models
+
+
+def populate_search_vectors(apps, schema_editor):
+    """Compute the search vector of every existing recipe."""
+    Recipe = apps.get_model('core', 'Recipe')
+    config = settings.RECIPE_SEARCH_CONFIG
+    vector = (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector('description', weight='B', config=config)
+    )
+    for through, target in (
+        (Recipe.tags.through, 'tag'),
+        (Recipe.ingredients.through, 'ingredient'),
+    ):
+        names = through.objects.filter(
+            recipe=models.OuterRef('pk'),
+        ).values('recipe').annotate(
+            names=StringAgg(f'{target}__name', delimiter=' '),
+        ).values('names')
+        vector += SearchVector(
+            models.Subquery(names), weight='C', config=config)
+    Recipe.objects.update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0010_recipe_attr_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            populate_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_recipe_counts(apps, schema_editor):
+    """Count the recipes using every existing tag and ingredient."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, through, target in (
+        ('Tag', Recipe.tags.through, 'tag'),
+        ('Ingredient', Recipe.ingredients.through, 'ingredient'),
+    ):
+        total = through.objects.filter(
+            **{target: models.OuterRef('pk')},
+        ).values(target).annotate(total=models.Count('*')).values('total')
+        apps.get_model('core', model_name).objects.update(
+            recipe_count=Coalesce(models.Subquery(total), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipe_attr_autocomplete_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(
+            populate_recipe_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count', 'name'], name='tag_user_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count', 'name'], name='ingredient_user_count_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:38
+
+import core.models
+import core.storage
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_stored_files(apps, schema_editor):
+    """Count the recipes using every existing image and rendition file."""
+    Recipe = apps.get_model('core', 'Recipe')
+    StoredFile = apps.get_model('core', 'StoredFile')
+    refs = Counter()
+    for image, renditions in Recipe.objects.filter(
+        models.Q(image__gt='') | ~models.Q(image_renditions={}),
+    ).values_list('image', 'image_renditions').iterator():
+        if image:
+            refs[image] += 1
+        for rendition in renditions.values():
+            refs.update(
+                name for name in rendition.values() if isinstance(name, str))
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name, refs=count) for name, count in refs.items()],
+        batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(
+            count_stored_files, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.recipe_image_storage, upload_to=core.models.recipe_image_file_path),
+        ),
+    ]
@@ -1,12 +1,27 @@
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchVector,
+    SearchVectorField,
+    TrigramSimilarity,
+)
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 from django.conf import settings
+from django.utils import timezone
 import uuid
 import os
+import re
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from core.images import RENDITION_FORMATS
+from core.storage import recipe_image_storage
 
 
 def recipe_image_file_path(instance, filename):
@@ -40,6 +55,124 @@ class UserManager(BaseUserManager):
         return user
 
 
+class RecipeAttrQuerySet(models.QuerySet):
+    """Queries for recipe attributes."""
+
+    def assigned(self):
+        """Only return attributes used by at least one recipe."""
+        return self.filter(recipe_count__gt=0)
+
+    def adjust_recipe_count(self, deltas):
+        """Add a delta to the recipe counter of each object in a mapping.
+
+        Objects sharing a delta are updated together, so adding one recipe
+        to many attributes takes a single UPDATE.
+        """
+        by_delta = defaultdict(list)
+        for pk, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(pk)
+        for delta, pks in by_delta.items():
+            # never go negative, even if a counter has drifted
+            self.filter(pk__in=pks).update(recipe_count=Greatest(
+                models.F('recipe_count') + delta, 0))
+
+    def _recipe_total(self):
+        # count the through rows of each object from the outer query
+        related = self.model.recipe_set
+        target = related.field.m2m_reverse_field_name()
+        total = related.through.objects.filter(
+            **{target: models.OuterRef('pk')},
+        ).values(target).annotate(total=models.Count('*')).values('total')
+        return Coalesce(models.Subquery(total), 0)
+
+    def with_recipe_total(self):
+        """Annotate the number of recipes counted from the through table."""
+        return self.annotate(recipe_total=self._recipe_total())
+
+    def refresh_recipe_count(self):
+        """Recount the recipes of each object from the through table."""
+        return self.update(recipe_count=self._recipe_total())
+
+    def suggest(self, q=None, prefix=None):
+        """Return attributes matching a search, best suggestions first.
+
+        A prefix is matched case-sensitively with LIKE 'prefix%'; q matches
+        names similar to or containing it, ranked by trigram similarity.
+        Ties are broken by how many recipes use the attribute. Containment
+        uses a case-insensitive regex rather than icontains so that both
+        conditions can be answered from the trigram index.
+        """
+        queryset = self
+        if prefix:
+            queryset = queryset.filter(name__startswith=prefix)
+        if q:
+            similar = models.Q(name__trigram_similar=q)
+            contains = models.Q(name__iregex=re.escape(q))
+            queryset = queryset.filter(similar | contains).annotate(
+                similarity=TrigramSimilarity('name', q))
+        else:
+            queryset = queryset.annotate(
+                similarity=models.Value(1.0, output_field=models.FloatField()))
+        return queryset.order_by('-similarity', '-recipe_count', 'name')
+
+
+class RecipeAttrManager(models.Manager.from_queryset(RecipeAttrQuerySet)):
+    """Manager for recipe attributes identified by name."""
+
+    def get_or_create_many(self, user, names):
+        """Return objects for the names, creating missing ones in bulk."""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return []
+
+        found = {obj.name: obj for obj in self.filter(user=user, name__in=names)}
+        missing = [name for name in names if name not in found]
+        if missing:
+            # a fixed insert order keeps concurrent writers from deadlocking
+            # on each other's unique index entries
+            found.update(self._insert_missing(user, sorted(missing)))
+        lost = [name for name in missing if name not in found]
+        if lost:
+            # inserted by a concurrent writer since the first read
+            found.update(
+                (obj.name, obj)
+                for obj in self.filter(user=user, name__in=lost)
+            )
+
+        return [found[name] for name in names]
+
+    def _insert_missing(self, user, names):
+        # insert names in one statement, skipping ones that exist by now
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        user_column = quote(opts.get_field('user').column)
+        name_column = quote(opts.get_field('name').column)
+        count_column = quote(opts.get_field('recipe_count').column)
+        sql = (
+            f'INSERT INTO {quote(opts.db_table)} '
+            f'({user_column}, {name_column}, {count_column}) '
+            f'VALUES {", ".join(["(%s, %s, 0)"] * len(names))} '
+            f'ON CONFLICT ({user_column}, {name_column}) DO NOTHING '
+            f'RETURNING {quote(opts.pk.column)}, {name_column}'
+        )
+        params = [value for name in names for value in (user.pk, name)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        for pk, name in rows:
+            values = {
+                'id': pk, 'user_id': user.pk, 'name': name, 'recipe_count': 0,
+            }
+            yield name, self.model.from_db(
+                self.db,
+                [field.attname for field in opts.concrete_fields],
+                [values[field.attname] for field in opts.concrete_fields],
+            )
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """User in the system."""
     email = models.EmailField(max_length=255, unique=True)
@@ -52,6 +185,94 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+def recipe_attr_prefetches():
+    """Return lookups prefetching the id and name of tags and ingredients.
+
+    Attributes are ordered by id, as recipe.representations lists them.
+    """
+    return (
+        models.Prefetch('tags', queryset=Tag.objects.only(
+            'id', 'name').order_by('id')),
+        models.Prefetch('ingredients', queryset=Ingredient.objects.only(
+            'id', 'name').order_by('id')),
+    )
+
+
+def recipe_search_vector():
+    """Return the expression computing a recipe's full-text search vector.
+
+    Titles rank above descriptions, which rank above tag and ingredient
+    names. Names are aggregated with correlated subqueries so the vector
+    can be refreshed for many recipes in a single UPDATE.
+    """
+    config = settings.RECIPE_SEARCH_CONFIG
+    vector = SearchVector('title', weight='A', config=config)
+    vector += SearchVector('description', weight='B', config=config)
+    for name in ('tags', 'ingredients'):
+        related = getattr(Recipe, name)
+        source = related.field.m2m_field_name()
+        target = related.field.m2m_reverse_field_name()
+        names = related.through.objects.filter(
+            **{source: models.OuterRef('pk')},
+        ).values(source).annotate(
+            names=StringAgg(f'{target}__name', delimiter=' '),
+        ).values('names')
+        vector += SearchVector(
+            models.Subquery(names), weight='C', config=config)
+    return vector
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Queries for recipes."""
+
+    def update_search_vector(self, **fields):
+        """Recompute the search vector of the recipes, with other fields."""
+        return self.update(search_vector=recipe_search_vector(), **fields)
+
+    def with_attrs(self):
+        """Prefetch the id and name of recipe tags and ingredients."""
+        return self.prefetch_related(*recipe_attr_prefetches())
+
+    def with_related(self, name, ids, match_all=False):
+        """Filter recipes linked to any, or all, of the ids in an M2M field.
+
+        Uses subqueries on the through table instead of joining it, so
+        recipes are never repeated and no DISTINCT is needed.
+        """
+        related = getattr(self.model, name)
+        source = related.field.m2m_field_name()
+        target = related.field.m2m_reverse_field_name()
+        ids = set(ids)
+        links = related.through.objects.filter(**{f'{target}__in': ids})
+        if not match_all:
+            return self.filter(models.Exists(
+                links.filter(**{source: models.OuterRef('pk')})))
+
+        # links are unique, so a recipe has every id when it has len(ids)
+        complete = links.values(source).annotate(
+            total=models.Count('*')).filter(total=len(ids)).values(source)
+        return self.filter(pk__in=complete)
+
+    def facet_counts(self, name):
+        """Count the recipes linked to each attribute of an M2M field.
+
+        Runs a single aggregate query over the through table restricted to
+        the recipes of this queryset, most used attributes first.
+        """
+        related = getattr(self.model, name)
+        source = related.field.m2m_field_name()
+        target = related.field.m2m_reverse_field_name()
+        rows = related.through.objects.filter(
+            **{f'{source}__in': self.order_by().values('pk')},
+        ).values_list(target, f'{target}__name').annotate(
+            total=models.Count('*'),
+        ).order_by('-total', f'{target}__name')
+        return [
+            {'id': pk, 'name': attr_name, 'count': total}
+            for pk, attr_name, total in rows
+        ]
+
+
 class Recipe(models.Model):
     # Recipe model
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
@@ -63,17 +284,153 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image = models.ImageField(null=True, upload_to=recipe_image_file_path,
+                              storage=recipe_image_storage)
+    # resized copies of the image, see core.images.create_renditions
+    image_renditions = models.JSONField(default=dict, editable=False)
+    external_id = models.CharField(max_length=64, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'external_id'],
+                condition=models.Q(external_id__isnull=False),
+                name='unique_recipe_external_id',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+def recipe_file_names(image, renditions):
+    """Return the stored files of a recipe image and its renditions."""
+    names = [image] if image else []
+    for rendition in renditions.values():
+        names.extend(rendition[fmt] for fmt in RENDITION_FORMATS)
+    return names
+
+
+class StoredFileManager(models.Manager):
+    """Reference counting of stored recipe image files."""
+
+    def retain(self, names):
+        """Count one more reference to each name, once per occurrence."""
+        counts = Counter(names)
+        if not counts:
+            return
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        table = quote(opts.db_table)
+        name_column = quote(opts.get_field('name').column)
+        refs_column = quote(opts.get_field('refs').column)
+        sql = (
+            f'INSERT INTO {table} ({name_column}, {refs_column}) '
+            f'VALUES {", ".join(["(%s, %s)"] * len(counts))} '
+            f'ON CONFLICT ({name_column}) DO UPDATE '
+            f'SET {refs_column} = {table}.{refs_column} + '
+            f'EXCLUDED.{refs_column}'
+        )
+        # a consistent order keeps concurrent upserts from deadlocking
+        params = [
+            value for name in sorted(counts)
+            for value in (name, counts[name])
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def release(self, names):
+        """Drop one reference to each name, once per occurrence.
+
+        Files left without references are deleted once the transaction
+        commits.
+        """
+        by_delta = defaultdict(list)
+        for name, delta in Counter(names).items():
+            by_delta[delta].append(name)
+        for delta, delta_names in by_delta.items():
+            # never go negative, even if a counter has drifted
+            self.filter(name__in=delta_names).update(
+                refs=Greatest(models.F('refs') - delta, 0))
+        if by_delta:
+            unused = list(self.filter(
+                name__in=Counter(names), refs=0,
+            ).values_list('name', flat=True))
+            if unused:
+                transaction.on_commit(
+                    lambda: self.delete_unused(unused), using=self.db)
+
+    def delete_unused(self, names):
+        """Delete the files of names that no recipe uses, and their rows.
+
+        Files stored within RECIPE_IMAGE_DELETE_DELAY are kept, as an
+        upload of the same content may be about to use them.
+        """
+        storage = Recipe._meta.get_field('image').storage
+        kept_after = timezone.now() - timedelta(
+            seconds=settings.RECIPE_IMAGE_DELETE_DELAY)
+        for name in sorted(names):
+            with transaction.atomic(using=self.db):
+                # recipes starting to use the file wait until it is gone
+                unused = self.filter(name=name, refs=0)
+                if not unused.select_for_update().exists():
+                    continue
+                try:
+                    if storage.get_modified_time(name) > kept_after:
+                        continue
+                    storage.delete(name)
+                except FileNotFoundError:
+                    pass
+                unused.delete()
+
+
+class StoredFile(models.Model):
+    """Number of recipes using a stored image or rendition file."""
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+
+    objects = StoredFileManager()
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
+
+
 class Tag(models.Model):
     # Tag model
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
+    # kept up to date by signals; repair drift with repair_counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_tag_user_name'),
+        ]
+        indexes = [
+            # fuzzy and substring autocomplete lookups
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'],
+                     name='tag_name_trgm_idx'),
+            # LIKE 'prefix%' lookups, whatever the database collation
+            models.Index(fields=['user', 'name'],
+                         opclasses=['int8_ops', 'varchar_pattern_ops'],
+                         name='tag_name_prefix_idx'),
+            # assigned_only and most used first
+            models.Index(fields=['user', '-recipe_count', 'name'],
+                         name='tag_user_count_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -84,6 +441,69 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
+    # kept up to date by signals; repair drift with repair_counters
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'], name='unique_ingredient_user_name'),
+        ]
+        indexes = [
+            # fuzzy and substring autocomplete lookups
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'],
+                     name='ingredient_name_trgm_idx'),
+            # LIKE 'prefix%' lookups, whatever the database collation
+            models.Index(fields=['user', 'name'],
+                         opclasses=['int8_ops', 'varchar_pattern_ops'],
+                         name='ingredient_name_prefix_idx'),
+            # assigned_only and most used first
+            models.Index(fields=['user', '-recipe_count', 'name'],
+                         name='ingredient_user_count_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class Job(models.Model):
+    """Background job queued in the database, see core.jobs."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                             on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the queue itself: runnable jobs in the order they are claimed
+            models.Index(fields=['run_after', 'id'], name='job_pending_idx',
+                         condition=models.Q(status='pending')),
+            # running jobs whose worker may have died
+            models.Index(fields=['started_at'], name='job_running_idx',
+                         condition=models.Q(status='running')),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
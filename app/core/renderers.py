@@ -0,0 +1,59 @@
+"""
+Renderers for the API.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Render JSON with orjson, straight to bytes, when it is installed.
+
+    Output matches JSONRenderer: datetimes and UUIDs are encoded natively
+    in the same form, and Decimal and the other types orjson does not know
+    are converted by the encoder_class. Indented or ASCII-only output, as
+    the browsable API asks for, falls back to JSONRenderer, as does data
+    orjson refuses to encode. Unlike with STRICT_JSON, NaN and infinite
+    floats are written as null.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        fallback = orjson is None or self.ensure_ascii or not self.compact
+        if fallback or indent is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            # such as integers wider than 64 bits, which json still encodes
+            return super().render(data, accepted_media_type, renderer_context)
+        # keep the output a strict javascript subset, as JSONRenderer does
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Render a sequence of objects as newline-delimited JSON."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+    line_renderer_class = FastJSONRenderer
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, (list, tuple)):
+            data = [data]
+        return b''.join(self.render_lines(data))
+
+    def render_lines(self, items):
+        """Yield one encoded line per item."""
+        renderer = self.line_renderer_class()
+        for item in items:
+            yield renderer.render(item) + b'\n'
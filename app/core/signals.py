@@ -0,0 +1,192 @@
+"""
+Signal handlers for core models.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_token
+from core.cache import reset_user_version
+from core.models import (
+    Recipe,
+    StoredFile,
+    Tag,
+    Ingredient,
+    recipe_file_names,
+)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """Stop authenticating with a deleted token."""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    """Drop cached tokens when a user is updated or deactivated."""
+    if created:
+        reset_user_version(instance)
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+            'key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_search_vector(sender, instance, update_fields=None,
+                                 **kwargs):
+    """Recompute the search vector when searchable text may have changed."""
+    if update_fields is None or {'title', 'description'} & set(update_fields):
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_on_attrs_changed(sender, instance, action, reverse,
+                                   pk_set, **kwargs):
+    """Bump the modification time and search vector of changed recipes."""
+    now = timezone.now()
+    if reverse:
+        if action == 'pre_clear':
+            # remember the recipes before their links disappear
+            instance._cleared_recipe_ids = list(
+                instance.recipe_set.values_list('id', flat=True))
+        elif action == 'post_clear':
+            pk_set = instance.__dict__.pop('_cleared_recipe_ids', [])
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Recipe.objects.filter(pk__in=pk_set).update_search_vector(
+                updated_at=now)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        Recipe.objects.filter(pk=instance.pk).update_search_vector(
+            updated_at=now)
+        instance.updated_at = now
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_recipes_on_attr_saved(sender, instance, created, **kwargs):
+    """Bump the modification time and search vector of recipes using it."""
+    if not created:
+        instance.recipe_set.update_search_vector(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_attr_recipes(sender, instance, **kwargs):
+    """Remember the recipes of an attribute before its links are deleted."""
+    instance._deleted_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def touch_recipes_on_attr_deleted(sender, instance, **kwargs):
+    """Bump the modification time and search vector of recipes that used it."""
+    recipe_ids = instance.__dict__.pop('_deleted_recipe_ids', [])
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update_search_vector(
+            updated_at=timezone.now())
+
+
+def _recipe_m2m_field(through):
+    # return the recipe M2M field stored in a through model
+    return next(
+        field for field in Recipe._meta.many_to_many
+        if field.remote_field.through is through
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_attr_recipes(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep the recipe counters of tags and ingredients up to date."""
+    field = _recipe_m2m_field(sender)
+    recipe_column = field.m2m_field_name()
+    attr_column = field.m2m_reverse_field_name()
+    if reverse:
+        own_column, other_column = attr_column, recipe_column
+    else:
+        own_column, other_column = recipe_column, attr_column
+
+    if action in ('pre_remove', 'pre_clear'):
+        # only links that exist now will be removed
+        links = sender.objects.filter(**{own_column: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other_column}__in': pk_set})
+        instance._unlinked_ids = list(
+            links.values_list(other_column, flat=True))
+        return
+    if action == 'post_add':
+        # add() only reports the links it inserted
+        changed, delta = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, delta = instance.__dict__.pop('_unlinked_ids', []), -1
+    else:
+        return
+
+    attrs = field.related_model.objects
+    if reverse:
+        attrs.adjust_recipe_count({instance.pk: delta * len(changed)})
+    else:
+        attrs.adjust_recipe_count({pk: delta for pk in changed})
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_attrs(sender, instance, **kwargs):
+    """Remember the attributes of a recipe before its links are deleted."""
+    instance._deleted_attr_ids = {
+        field.name: list(field.remote_field.through.objects.filter(
+            **{field.m2m_field_name(): instance.pk},
+        ).values_list(field.m2m_reverse_field_name(), flat=True))
+        for field in Recipe._meta.many_to_many
+    }
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, **kwargs):
+    """Decrement the recipe counters of the attributes a recipe used."""
+    attr_ids = instance.__dict__.pop('_deleted_attr_ids', {})
+    for field in Recipe._meta.many_to_many:
+        field.related_model.objects.adjust_recipe_count(
+            {pk: -1 for pk in attr_ids.get(field.name, [])})
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_files(sender, instance, update_fields=None, **kwargs):
+    """Remember the stored files a recipe used before it is saved."""
+    if instance.pk is None or update_fields is not None and not (
+            {'image', 'image_renditions'} & set(update_fields)):
+        return
+    saved = Recipe.objects.filter(pk=instance.pk).values_list(
+        'image', 'image_renditions').first()
+    instance._saved_file_names = recipe_file_names(*saved) if saved else []
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_files(sender, instance, created, **kwargs):
+    """Count references to the stored files a saved recipe uses."""
+    if not created and '_saved_file_names' not in instance.__dict__:
+        return
+    before = Counter(instance.__dict__.pop('_saved_file_names', []))
+    after = Counter(recipe_file_names(
+        instance.image.name, instance.image_renditions))
+    StoredFile.objects.retain(after - before)
+    StoredFile.objects.release(before - after)
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_deleted_recipe_files(sender, instance, **kwargs):
+    """Release the stored files a deleted recipe used."""
+    StoredFile.objects.release(recipe_file_names(
+        instance.image.name, instance.image_renditions))
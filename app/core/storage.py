@@ -0,0 +1,99 @@
+"""
+Content-addressed file storage.
+
+Files are named after the SHA-256 digest of their content and sharded two
+levels deep, as <directory>/ab/cd/<digest><ext>, so identical files are
+kept once and no directory grows past a few hundred entries. Which stored
+files are still used is counted by core.models.StoredFile.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+
+
+def content_name(directory, digest, ext):
+    """Return the sharded storage name of content with a hex digest."""
+    return os.path.join(directory, digest[:2], digest[2:4], digest + ext)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files after a digest of their content.
+
+    Only the directory and extension of a requested name are kept. Saving
+    content that is already stored returns the existing name. Uploads
+    already written to a temporary file on the same file system are
+    renamed into place rather than copied.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is only known once the content is read in _save
+        return name
+
+    def _makedirs(self, directory):
+        # create a directory with FILE_UPLOAD_DIRECTORY_PERMISSIONS
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _stage(self, directory, content):
+        # return the path of a file with the content on this file system,
+        # its digest, and whether the file was created for staging
+        digest = hashlib.sha256()
+        if hasattr(content, 'temporary_file_path'):
+            path = content.temporary_file_path()
+            if os.stat(path).st_dev == os.stat(self.path(directory)).st_dev:
+                # an upload already on disk here is hashed and moved as is
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                return path, digest.hexdigest(), False
+        # stream to a temporary file next to the final location, hashing on
+        # the way, so it can be renamed into place atomically
+        fd, path = tempfile.mkstemp(
+            dir=self.path(directory), prefix='.', suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest(), True
+
+    def _save(self, name, content):
+        directory, basename = os.path.split(name)
+        ext = os.path.splitext(basename)[1].lower()
+        self._makedirs(self.path(directory))
+        tmp_path, digest, staged = self._stage(directory, content)
+        name = content_name(directory, digest, ext)
+        full_path = self.path(name)
+        try:
+            if os.path.exists(full_path):
+                # mark the existing file as just stored, see StoredFile
+                os.utime(full_path)
+            else:
+                self._makedirs(os.path.dirname(full_path))
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, full_path)
+                staged = False
+        finally:
+            if staged:
+                os.remove(tmp_path)
+        return name.replace('\\', '/')
+
+
+def recipe_image_storage():
+    """Return the storage of recipe images and their renditions."""
+    if settings.RECIPE_IMAGE_CONTENT_ADDRESSED:
+        return ContentAddressedStorage()
+    return default_storage
@@ -0,0 +1,104 @@
+"""
+Tests for cached token authentication.
+"""
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from core.authentication import (
+    CachedTokenAuthentication,
+    LRUCache,
+    local_tokens,
+)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with cached tokens"""
+
+    def setUp(self):
+        local_tokens.clear()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_authenticate_cached(self):
+        """Test repeated authentication does not query the database"""
+        user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token, self.token)
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+    def test_shared_cache_used_when_local_missing(self):
+        """Test the cache framework is used after the local LRU expires"""
+        self.auth.authenticate_credentials(self.token.key)
+        local_tokens.clear()
+
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+    def test_invalid_token(self):
+        """Test an unknown token is rejected"""
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials('invalid')
+
+    def test_deleted_token_invalidated(self):
+        """Test deleting a token stops it authenticating"""
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deactivated_user_invalidated(self):
+        """Test deactivating a user stops their token authenticating"""
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_updated_user_refreshed(self):
+        """Test updating a user refreshes the cached user"""
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.name = 'New name'
+        self.user.save()
+
+        user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.name, 'New name')
+
+
+class LRUCacheTests(SimpleTestCase):
+    """Test the in-process LRU cache"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the oldest unused entry is evicted when full"""
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    @patch('core.authentication.time.monotonic')
+    def test_entries_expire(self, patched_monotonic):
+        """Test entries are dropped after their TTL"""
+        patched_monotonic.return_value = 100
+        lru = LRUCache(maxsize=2, ttl=5)
+        lru.set('a', 1)
+
+        patched_monotonic.return_value = 104
+        self.assertEqual(lru.get('a'), 1)
+        patched_monotonic.return_value = 105
+        self.assertIsNone(lru.get('a'))
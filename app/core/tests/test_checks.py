@@ -0,0 +1,27 @@
+"""
+Tests for the core system checks.
+"""
+from django.test import SimpleTestCase, override_settings
+
+from core.checks import check_shared_caches
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """Test caches shared by processes must not be process-local"""
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_memory_cache_refused(self):
+        """Test a local memory cache is reported as an error"""
+        errors = check_shared_caches(None)
+
+        self.assertEqual(
+            [error.id for error in errors], ['core.E001', 'core.E001'])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': 'cache:11211',
+    }})
+    def test_shared_cache_accepted(self):
+        """Test a memcached cache passes the check"""
+        self.assertEqual(check_shared_caches(None), [])
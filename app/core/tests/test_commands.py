@@ -1,11 +1,20 @@
 """
 Test the custom management commands.
 """
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
 from unittest.mock import patch
 from psycopg2 import OperationalError as Psycopg2Error
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from core.models import Job, Recipe, StoredFile, Tag, Ingredient
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -28,3 +37,227 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class ImportRecipesTests(TestCase):
+    """Test the import_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+
+    def _import(self, recipes, **options):
+        """Write recipes to an NDJSON file and import it."""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as source:
+            for recipe in recipes:
+                source.write(json.dumps(recipe) + '\n')
+            source.flush()
+            out = StringIO()
+            call_command('import_recipes', source.name,
+                         user=self.user.email, stdout=out, **options)
+        return out.getvalue()
+
+    def _recipes(self, count):
+        """Return sample recipes sharing a tag."""
+        return [{
+            'title': f'Recipe {i}',
+            'time_minutes': 10,
+            'price': '4.50',
+            'tags': [{'name': 'Imported'}, {'name': f'Tag {i}'}],
+            'ingredients': [{'name': 'Salt'}],
+        } for i in range(count)]
+
+    def test_import_recipes(self):
+        """Test importing recipes with tags and ingredients."""
+        Tag.objects.create(user=self.user, name='Imported')
+
+        out = self._import(self._recipes(5), batch_size=2)
+
+        self.assertIn('rows/s', out)
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 6)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 1)
+
+    def test_import_is_idempotent(self):
+        """Test importing the same file twice creates nothing new."""
+        recipes = self._recipes(3)
+        self._import(recipes)
+        self._import(recipes)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Recipe.tags.through.objects.count(), 6)
+
+    def test_import_invalid_line(self):
+        """Test an invalid line aborts the import."""
+        recipes = self._recipes(2)
+        del recipes[1]['title']
+
+        with self.assertRaises(CommandError):
+            self._import(recipes)
+
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_import_too_long_values(self):
+        """Test values longer than their column abort with the line."""
+        for field, value in (
+            ('title', 'x' * 256),
+            ('link', 'https://example.com/' + 'x' * 250),
+            ('external_id', 'x' * 65),
+            ('tags', [{'name': 'x' * 256}]),
+        ):
+            recipes = self._recipes(2)
+            recipes[1][field] = value
+
+            with self.subTest(field), self.assertRaisesMessage(
+                    CommandError, 'Invalid recipe on line 2'):
+                self._import(recipes)
+
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_import_counts_recipes(self):
+        """Test imported links update the recipe counters."""
+        self._import(self._recipes(3))
+        self._import(self._recipes(4))
+
+        self.assertEqual(
+            Tag.objects.get(user=self.user, name='Imported').recipe_count, 4)
+        self.assertEqual(
+            Tag.objects.get(user=self.user, name='Tag 3').recipe_count, 1)
+        self.assertEqual(
+            Ingredient.objects.get(user=self.user).recipe_count, 4)
+
+
+class RepairCountersTests(TestCase):
+    """Test the repair_counters command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price='1.00')
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+        Tag.objects.update(recipe_count=7)
+
+    def test_repair_counters(self):
+        """Test drifted counters are recounted."""
+        out = StringIO()
+        call_command('repair_counters', stdout=out)
+
+        self.assertIn('Fixed 1 drifted tag counters', out.getvalue())
+        self.assertIn('Fixed 0 drifted ingredient counters', out.getvalue())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 1)
+
+    def test_repair_counters_dry_run(self):
+        """Test a dry run only reports drifted counters."""
+        out = StringIO()
+        call_command('repair_counters', dry_run=True, stdout=out)
+
+        self.assertIn('Found 1 drifted tag counters', out.getvalue())
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 7)
+
+    def test_repair_stored_file_counters(self):
+        """Test drifted stored file references are recounted."""
+        Recipe.objects.update(image='uploads/recipe/used.jpg')
+        StoredFile.objects.create(name='uploads/recipe/unused.jpg', refs=2)
+
+        out = StringIO()
+        call_command('repair_counters', stdout=out)
+
+        self.assertIn('Fixed 2 drifted stored file counters', out.getvalue())
+        self.assertEqual(
+            dict(StoredFile.objects.values_list('name', 'refs')),
+            {'uploads/recipe/used.jpg': 1, 'uploads/recipe/unused.jpg': 0})
+
+
+class GcMediaTests(TestCase):
+    """Test the gc_media command."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        Recipe.objects.create(
+            user=user, title='Salad', time_minutes=5, price='1.00')
+        # set directly, so no file is counted as stored
+        Recipe.objects.update(
+            image='uploads/recipe/ab/cd/used.jpg',
+            image_renditions={'thumb': {
+                'width': 10, 'height': 10,
+                'webp': 'uploads/recipe/ef/01/thumb.webp',
+                'jpeg': 'uploads/recipe/23/45/thumb.jpg',
+            }})
+        Job.objects.create(
+            name='export_recipes', status=Job.DONE,
+            result={'file': 'exports/recipes.ndjson'})
+        StoredFile.objects.create(name='uploads/recipe/ab/cd/old.jpg')
+        self.kept = [
+            'uploads/recipe/ab/cd/used.jpg',
+            'uploads/recipe/ef/01/thumb.webp',
+            'uploads/recipe/23/45/thumb.jpg',
+            'exports/recipes.ndjson',
+        ]
+        for name in self.kept + ['uploads/recipe/ab/cd/old.jpg']:
+            self._write(name, age=7200)
+        # an upload not yet saved on its recipe
+        self._write('uploads/recipe/67/89/new.jpg', age=0)
+
+    def _write(self, name, age):
+        # create a media file last modified age seconds ago
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as media_file:
+            media_file.write(b'x' * 1000)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self.media_root, name))
+
+    def test_gc_media(self):
+        """Test old files nothing references are deleted."""
+        out = StringIO()
+        call_command('gc_media', min_age=3600, rate=0, stdout=out)
+
+        self.assertIn('Deleted 1 orphaned files', out.getvalue())
+        self.assertIn('of 6 scanned', out.getvalue())
+        self.assertFalse(self._exists('uploads/recipe/ab/cd/old.jpg'))
+        self.assertFalse(StoredFile.objects.exists())
+        for name in self.kept + ['uploads/recipe/67/89/new.jpg']:
+            self.assertTrue(self._exists(name))
+
+    def test_gc_media_dry_run(self):
+        """Test a dry run only reports orphaned files."""
+        out = StringIO()
+        call_command('gc_media', min_age=3600, dry_run=True, verbosity=2,
+                     stdout=out)
+
+        self.assertIn('uploads/recipe/ab/cd/old.jpg', out.getvalue())
+        self.assertIn('Found 1 orphaned files', out.getvalue())
+        self.assertTrue(self._exists('uploads/recipe/ab/cd/old.jpg'))
+
+    @patch('core.management.commands.gc_media.time.sleep')
+    def test_gc_media_rate_limited(self, patched_sleep):
+        """Test deletions are spread out to the given rate."""
+        for n in range(3):
+            self._write(f'uploads/recipe/00/00/orphan{n}.jpg', age=7200)
+
+        call_command('gc_media', min_age=3600, rate=2, stdout=StringIO())
+
+        # four deletions at two per second, the last 1.5s after the first
+        self.assertEqual(patched_sleep.call_count, 3)
+        self.assertAlmostEqual(patched_sleep.call_args.args[0], 1.5, 1)
@@ -0,0 +1,148 @@
+"""
+Tests for recipe image renditions.
+"""
+import io
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings, tag
+from PIL import Image
+from core.images import RENDITION_FORMATS, create_renditions
+from core.models import Recipe
+
+
+def image_bytes(size, fmt='JPEG', mode='RGB', color='red', exif=None,
+                **params):
+    """Return an encoded sample image"""
+    image = Image.new(mode, size, color)
+    buffer = io.BytesIO()
+    if exif is not None:
+        params['exif'] = exif
+    image.save(buffer, fmt, **params)
+    return buffer.getvalue()
+
+
+def photo_bytes(size=(4032, 3024)):
+    """Return a JPEG resembling a phone photo, with detail at every scale"""
+    width, height = size
+    texture = Image.effect_noise((width // 16, height // 16), 80).resize(
+        size, Image.BICUBIC)
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.blend(Image.radial_gradient('L').resize(size), texture, 0.5)
+    blue = Image.blend(texture, Image.effect_noise(size, 60), 0.3)
+    image = Image.merge('RGB', (red, green, blue))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+class RenditionTestCase(TestCase):
+    """Store media in a temporary directory"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.recipe = Recipe.objects.create(
+            user=get_user_model().objects.create_user(
+                'user@example.com', 'testpass123'),
+            title='Sample recipe', time_minutes=5, price=Decimal('1.00'))
+
+    def _renditions(self, content, name='photo.jpg'):
+        # store an image on the recipe and render it
+        self.recipe.image.save(name, ContentFile(content))
+        return create_renditions(self.recipe.image)
+
+    def _open(self, rendition, fmt):
+        # open a stored rendition
+        return Image.open(self.recipe.image.storage.open(rendition[fmt]))
+
+
+class RenditionTests(RenditionTestCase):
+    """Test creating resized copies of images"""
+
+    def test_sizes_bounded(self):
+        """Test renditions fit their size and keep the aspect ratio"""
+        renditions = self._renditions(image_bytes((2000, 1000)))
+
+        self.assertEqual(
+            {size: (r['width'], r['height']) for size, r in renditions.items()},
+            {'large': (1280, 640), 'medium': (640, 320), 'thumb': (160, 80)},
+        )
+        for fmt, (pil_format, ext) in RENDITION_FORMATS.items():
+            rendition = renditions['medium']
+            self.assertTrue(rendition[fmt].endswith(ext))
+            self.assertEqual(self._open(rendition, fmt).format, pil_format)
+            self.assertEqual(self._open(rendition, fmt).size, (640, 320))
+
+    def test_small_image_not_upscaled(self):
+        """Test images smaller than a rendition keep their size"""
+        renditions = self._renditions(image_bytes((100, 50)))
+
+        self.assertEqual(renditions['large']['width'], 100)
+        self.assertEqual(renditions['thumb']['width'], 100)
+
+    def test_exif_orientation_applied_and_stripped(self):
+        """Test renditions are upright and carry no metadata"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        exif[0x010F] = 'Phone maker'
+        renditions = self._renditions(
+            image_bytes((400, 200), exif=exif.tobytes()))
+
+        self.assertEqual(
+            (renditions['large']['width'], renditions['large']['height']),
+            (200, 400))
+        for fmt in RENDITION_FORMATS:
+            image = self._open(renditions['large'], fmt)
+            self.assertEqual(len(image.getexif()), 0)
+            self.assertNotIn('exif', image.info)
+
+    def test_transparency(self):
+        """Test transparent images keep alpha in WebP only"""
+        renditions = self._renditions(
+            image_bytes((100, 100), 'PNG', 'RGBA', (255, 0, 0, 128)),
+            'logo.png')
+
+        self.assertEqual(self._open(renditions['thumb'], 'webp').mode, 'RGBA')
+        self.assertEqual(self._open(renditions['thumb'], 'jpeg').mode, 'RGB')
+
+
+@tag('benchmark')
+class RenditionBenchmark(RenditionTestCase):
+    """Measure encode time and size of renditions of a 12MP photo"""
+
+    runs = 3
+
+    def test_rendition_encode(self):
+        """benchmark rendering a phone-sized photo"""
+        original = photo_bytes()
+        self.recipe.image.save('photo.jpg', ContentFile(original))
+        timings = []
+        for _ in range(self.runs):
+            start = time.perf_counter()
+            renditions = create_renditions(self.recipe.image)
+            timings.append(time.perf_counter() - start)
+
+        storage = self.recipe.image.storage
+        sizes = {
+            (size, fmt): storage.size(rendition[fmt])
+            for size, rendition in renditions.items()
+            for fmt in RENDITION_FORMATS
+        }
+        sys.stderr.write(
+            f'\nrenditions of a {len(original) / 1e6:.1f}MB photo in '
+            f'{statistics.median(timings) * 1000:.0f}ms: ' + ', '.join(
+                f'{size} {fmt} {length / 1e3:.0f}kB '
+                f'({1 - length / len(original):.1%} saved)'
+                for (size, fmt), length in sizes.items()
+            ) + '\n')
+        self.assertLess(sizes['large', 'webp'], len(original) / 10)
+        self.assertLess(sizes['large', 'jpeg'], len(original) / 5)
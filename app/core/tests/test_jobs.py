@@ -0,0 +1,200 @@
+"""
+Tests for the background job queue.
+"""
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job, Recipe
+
+
+@jobs.job
+def add_numbers(a, b):
+    """Job used by the tests, adding two numbers."""
+    return {'sum': a + b}
+
+
+@jobs.job
+def always_fail():
+    """Job used by the tests, always failing."""
+    raise RuntimeError('broken')
+
+
+class JobTests(TestCase):
+    """Test queueing and running jobs."""
+
+    def test_run_job(self):
+        """Test running a queued job stores its result."""
+        queued = jobs.enqueue('add_numbers', a=1, b=2)
+
+        ran = jobs.run_next()
+
+        self.assertEqual(ran.pk, queued.pk)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.DONE)
+        self.assertEqual(queued.result, {'sum': 3})
+        self.assertEqual(queued.attempts, 1)
+        self.assertIsNone(jobs.run_next())
+
+    def test_enqueue_unknown_job(self):
+        """Test queueing an unregistered job is an error."""
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no_such_job')
+
+    def test_jobs_run_in_order(self):
+        """Test jobs run oldest first and not before run_after."""
+        later = jobs.enqueue('add_numbers', a=1, b=1)
+        later.run_after = timezone.now() + timedelta(minutes=1)
+        later.save()
+        first = jobs.enqueue('add_numbers', a=2, b=2)
+        second = jobs.enqueue('add_numbers', a=3, b=3)
+
+        ran = [jobs.run_next(), jobs.run_next(), jobs.run_next()]
+
+        self.assertEqual([ran[0].pk, ran[1].pk], [first.pk, second.pk])
+        self.assertIsNone(ran[2])
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=10)
+    def test_failed_job_retried(self):
+        """Test failing jobs are retried later, then marked failed."""
+        queued = jobs.enqueue('always_fail')
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.run_next()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.PENDING)
+        self.assertIn('RuntimeError: broken', queued.error)
+        self.assertGreater(
+            queued.run_after, timezone.now() + timedelta(seconds=5))
+        self.assertIsNone(jobs.run_next())
+
+        Job.objects.filter(pk=queued.pk).update(run_after=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.run_next()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertEqual(queued.attempts, 2)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_stale_job_reclaimed(self):
+        """Test jobs abandoned by a dead worker are claimed again."""
+        stale = jobs.enqueue('add_numbers', a=1, b=2)
+        Job.objects.filter(pk=stale.pk).update(
+            status=Job.RUNNING, attempts=1,
+            started_at=timezone.now() - timedelta(minutes=5))
+        busy = jobs.enqueue('add_numbers', a=1, b=2)
+        Job.objects.filter(pk=busy.pk).update(
+            status=Job.RUNNING, attempts=1, started_at=timezone.now())
+
+        ran = jobs.run_next()
+
+        self.assertEqual(ran.pk, stale.pk)
+        self.assertEqual(ran.attempts, 2)
+        self.assertEqual(ran.status, Job.DONE)
+        self.assertIsNone(jobs.run_next())
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_TIMEOUT=60)
+    def test_stale_job_out_of_attempts_failed(self):
+        """Test abandoned jobs that used up their attempts are not retried."""
+        stale = jobs.enqueue('add_numbers', a=1, b=2)
+        Job.objects.filter(pk=stale.pk).update(
+            status=Job.RUNNING, attempts=2,
+            started_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertIsNone(jobs.run_next())
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, Job.FAILED)
+        self.assertEqual(stale.attempts, 2)
+        self.assertIsNotNone(stale.finished_at)
+        self.assertIn('Abandoned', stale.error)
+
+    def test_render_skips_replaced_image(self):
+        """Test rendering is skipped when the image changed since queued."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        recipe = Recipe.objects.create(
+            user=user, title='Sample recipe', time_minutes=5, price=1,
+            image='uploads/recipe/new.jpg')
+        jobs.enqueue(
+            'render_recipe_image', recipe_id=recipe.id,
+            image='uploads/recipe/old.jpg')
+
+        ran = jobs.run_next()
+
+        self.assertEqual(ran.result, {'skipped': True})
+
+    # closing connections would end the test case transaction
+    @patch('core.jobs.close_old_connections')
+    def test_run_workers_once(self, patched_close):
+        """Test the run_workers command runs the queued jobs."""
+        jobs.enqueue('add_numbers', a=1, b=2)
+        jobs.enqueue('add_numbers', a=3, b=4)
+        out = StringIO()
+
+        call_command('run_workers', workers=1, once=True, stdout=out)
+
+        self.assertIn('Ran 2 jobs', out.getvalue())
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+
+    def test_repair_counters_background(self):
+        """Test repair_counters can be queued as a job."""
+        out = StringIO()
+
+        call_command('repair_counters', background=True, stdout=out)
+
+        queued = Job.objects.get()
+        self.assertEqual(queued.name, 'repair_counters')
+        self.assertIn(f'Queued job {queued.pk}', out.getvalue())
+
+
+class ConcurrentJobTests(TransactionTestCase):
+    """Test workers sharing the queue."""
+
+    def test_workers_claim_distinct_jobs(self):
+        """Test concurrent workers never claim the same job."""
+        if connection.vendor != 'postgresql':
+            self.skipTest('SKIP LOCKED needs PostgreSQL')
+        for n in range(20):
+            jobs.enqueue('add_numbers', a=n, b=n)
+        claimed = []
+
+        def worker():
+            try:
+                while True:
+                    job = jobs.claim()
+                    if job is None:
+                        return
+                    claimed.append(job.pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(claimed), 20)
+        self.assertEqual(len(set(claimed)), 20)
+
+    def test_run_workers_pool(self):
+        """Test the run_workers command runs jobs in worker processes."""
+        if connection.vendor != 'postgresql':
+            self.skipTest('SKIP LOCKED needs PostgreSQL')
+        for n in range(6):
+            jobs.enqueue('add_numbers', a=n, b=n)
+        out = StringIO()
+
+        call_command('run_workers', workers=2, once=True, stdout=out)
+
+        self.assertIn('Ran 6 jobs', out.getvalue())
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 6)
@@ -1,8 +1,15 @@
 """
 Test for models.
 """
+import random
+import sys
+import threading
+import time
 from decimal import Decimal
-from django.test import TestCase
+from unittest import skipUnless
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, tag
 from django.contrib.auth import get_user_model
 from core import models
 from unittest.mock import patch
@@ -80,6 +87,29 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
+    def test_get_or_create_many_tags(self):
+        """Test resolving tag names reuses existing tags"""
+        user = create_user()
+        existing = models.Tag.objects.create(user=user, name='Vegan')
+
+        tags = models.Tag.objects.get_or_create_many(
+            user, ['Vegan', 'Dessert', 'Vegan'])
+
+        self.assertEqual([tag.name for tag in tags], ['Vegan', 'Dessert'])
+        self.assertEqual(tags[0], existing)
+        self.assertIsNotNone(tags[1].pk)
+        self.assertEqual(models.Tag.objects.filter(user=user).count(), 2)
+
+    def test_tag_name_unique_per_user(self):
+        """Test a user cannot have two tags with the same name"""
+        user = create_user()
+        models.Tag.objects.create(user=user, name='Vegan')
+        models.Tag.objects.create(
+            user=create_user('other@example.com'), name='Vegan')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='Vegan')
+
     @patch('core.models.uuid.uuid4')
     def test_recipe_file_name_uuid(self, mock_uuid):
         """ test generating image path"""
@@ -88,3 +118,133 @@ class ModelTests(TestCase):
         file_path = models.recipe_image_file_path(None, 'example.jpg')
 
         self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+
+
+class RecipeCountTests(TestCase):
+    """Test the recipe counters of tags and ingredients"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.vegan = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = models.Tag.objects.create(user=self.user, name='Quick')
+        self.recipes = [
+            models.Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price=Decimal('1.00'))
+            for i in range(3)
+        ]
+
+    def assertCounts(self, vegan, quick):
+        self.vegan.refresh_from_db()
+        self.quick.refresh_from_db()
+        self.assertEqual(
+            (self.vegan.recipe_count, self.quick.recipe_count),
+            (vegan, quick))
+
+    def test_count_add_and_remove(self):
+        """Test adding and removing tags of a recipe updates counters"""
+        recipe = self.recipes[0]
+        recipe.tags.add(self.vegan, self.quick)
+        recipe.tags.add(self.vegan)
+        self.assertCounts(1, 1)
+
+        self.recipes[1].tags.remove(self.vegan)
+        recipe.tags.remove(self.vegan)
+        self.assertCounts(0, 1)
+
+        recipe.tags.clear()
+        self.assertCounts(0, 0)
+
+    def test_count_reverse_add_and_clear(self):
+        """Test changing the recipes of a tag updates its counter"""
+        self.vegan.recipe_set.add(*self.recipes)
+        self.vegan.recipe_set.remove(self.recipes[0], self.recipes[0])
+        self.assertCounts(2, 0)
+
+        self.vegan.recipe_set.clear()
+        self.assertCounts(0, 0)
+
+    def test_count_recipe_deleted(self):
+        """Test deleting recipes decrements the counters of their tags"""
+        for recipe in self.recipes:
+            recipe.tags.add(self.vegan)
+        self.recipes[0].tags.add(self.quick)
+
+        self.recipes[0].delete()
+        models.Recipe.objects.filter(pk=self.recipes[1].pk).delete()
+
+        self.assertCounts(1, 0)
+
+    def test_assigned_uses_counter(self):
+        """Test assigned attributes are selected by their counter"""
+        self.recipes[0].tags.add(self.vegan)
+
+        self.assertEqual(list(models.Tag.objects.assigned()), [self.vegan])
+        self.assertIn('recipe_count', str(models.Tag.objects.assigned().query))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent connections')
+class RecipeAttrConcurrencyTests(TransactionTestCase):
+    """Test resolving names from many threads at once"""
+
+    threads = 8
+    rounds = 25
+
+    def _resolve(self, user, names, barrier, errors):
+        # resolve shuffled overlapping names, each round in a transaction
+        try:
+            barrier.wait()
+            for _ in range(self.rounds):
+                batch = random.sample(names, len(names) // 2)
+                with transaction.atomic():
+                    tags = models.Tag.objects.get_or_create_many(user, batch)
+                if [tag.name for tag in tags] != batch:
+                    errors.append(f'wrong tags for {batch}')
+        except Exception as exc:
+            errors.append(repr(exc))
+        finally:
+            connection.close()
+
+    def _run_writers(self, user, names):
+        # resolve names from all threads at once, return the seconds taken
+        barrier = threading.Barrier(self.threads)
+        errors = []
+        workers = [
+            threading.Thread(
+                target=self._resolve, args=(user, names, barrier, errors))
+            for _ in range(self.threads)
+        ]
+
+        start = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(errors, [])
+        return elapsed
+
+    def test_get_or_create_many_concurrent(self):
+        """Test concurrent writers never create duplicate tags"""
+        user = create_user()
+        names = [f'Tag {i}' for i in range(40)]
+
+        self._run_writers(user, names)
+
+        duplicates = models.Tag.objects.values('user', 'name').annotate(
+            total=Count('id')).filter(total__gt=1)
+        self.assertFalse(duplicates.exists())
+        self.assertEqual(
+            models.Tag.objects.filter(user=user).count(), len(names))
+
+    @tag('benchmark')
+    def test_get_or_create_many_throughput(self):
+        """benchmark resolving overlapping names from many threads"""
+        elapsed = self._run_writers(
+            create_user(), [f'Tag {i}' for i in range(40)])
+
+        calls = self.threads * self.rounds
+        sys.stderr.write(
+            f'\nget_or_create_many: {calls} calls in {elapsed:.2f}s '
+            f'({calls / elapsed:.0f} calls/s)\n')
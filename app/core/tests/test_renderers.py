@@ -0,0 +1,196 @@
+"""
+Tests for the JSON renderer and parser.
+"""
+import datetime
+import io
+import json
+import sys
+import time
+import uuid
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase, tag
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from core import renderers
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer, NDJSONRenderer
+
+
+def sample_data():
+    # return data with every type the API renders
+    return ReturnDict([
+        ('id', 1),
+        ('price', Decimal('5.50')),
+        ('created_at', datetime.datetime(
+            2021, 6, 1, 12, 30, 5, 120000, tzinfo=timezone.utc)),
+        ('finished_at', datetime.datetime(
+            2021, 6, 1, 14, 0, tzinfo=datetime.timezone(
+                datetime.timedelta(hours=2)))),
+        ('naive', datetime.datetime(2021, 6, 1, 12, 0)),
+        ('date', datetime.date(2021, 6, 1)),
+        ('time', datetime.time(7, 45)),
+        ('duration', datetime.timedelta(minutes=90)),
+        ('uuid', uuid.UUID('12345678-1234-5678-1234-567812345678')),
+        ('title', 'Crème brûlée "deluxe" \u2028\u2029 ☃'),
+        ('error', ErrorDetail('Invalid.', code='invalid')),
+        ('lazy', gettext_lazy('This field is required.')),
+        ('renditions', {1: 'one', 'thumb': None}),
+        ('tags', ReturnList([{'id': 2, 'name': 'Vegan'}], serializer=None)),
+        ('flags', (True, False, 0.25)),
+    ], serializer=None)
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Test the orjson renderer matches JSONRenderer"""
+
+    def test_parity(self):
+        """Test the same bytes are rendered as by JSONRenderer"""
+        data = sample_data()
+
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_indent_falls_back(self):
+        """Test indented output is rendered by JSONRenderer"""
+        data = sample_data()
+
+        for media_type, context in (
+            ('application/json; indent=4', {}),
+            (None, {'indent': 2}),
+        ):
+            self.assertEqual(
+                FastJSONRenderer().render(data, media_type, context),
+                JSONRenderer().render(data, media_type, context))
+
+    def test_unencodable_falls_back(self):
+        """Test data orjson refuses is rendered by JSONRenderer"""
+        data = {'id': 2 ** 64, 'tags': [-2 ** 70]}
+
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_without_orjson(self):
+        """Test JSONRenderer output without orjson installed"""
+        data = sample_data()
+
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(
+                FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_ndjson_lines(self):
+        """Test each NDJSON line is rendered as JSON"""
+        lines = NDJSONRenderer().render([{'id': 1}, sample_data()])
+
+        self.assertEqual(lines, b'{"id":1}\n' + JSONRenderer().render(
+            sample_data()) + b'\n')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """Test the orjson parser matches JSONParser"""
+
+    def _parse(self, parser, content, encoding='utf-8'):
+        return parser.parse(io.BytesIO(content), 'application/json',
+                            {'encoding': encoding})
+
+    def test_parity(self):
+        """Test bodies parse as with JSONParser"""
+        for content in (
+            JSONRenderer().render(sample_data()),
+            b'[1, 2.5, -3e2, null, true, "\\u00e9", 9223372036854775807]',
+        ):
+            self.assertEqual(
+                self._parse(FastJSONParser(), content),
+                self._parse(JSONParser(), content))
+
+    def test_errors(self):
+        """Test invalid bodies raise the JSONParser parse errors"""
+        for content in (b'{"title": ', b'[NaN]', b'\xff\xfe'):
+            with self.assertRaises(ParseError) as expected:
+                self._parse(JSONParser(), content)
+            with self.assertRaises(ParseError) as actual:
+                self._parse(FastJSONParser(), content)
+            self.assertEqual(
+                str(actual.exception.detail), str(expected.exception.detail))
+
+    def test_other_encoding(self):
+        """Test bodies in other encodings are decoded by JSONParser"""
+        content = '{"title": "Crème"}'.encode('latin-1')
+
+        self.assertEqual(
+            self._parse(FastJSONParser(), content, 'latin-1'),
+            {'title': 'Crème'})
+
+
+@tag('benchmark')
+class JSONThroughputBenchmark(SimpleTestCase):
+    """Compare JSON throughput of the stdlib and orjson on recipe lists"""
+
+    recipe_count = 10000
+    runs = 5
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        url = 'http://testserver/api/recipe/recipes/'
+        # a page of detail recipes as recipe.representations renders them
+        cls.data = [
+            {
+                'id': i, 'title': f'Recipe {i}', 'time_minutes': i % 120,
+                'price': '4.20', 'link': 'https://example.com/recipe',
+                'tags': [{'id': j, 'name': f'Tag {j}'} for j in range(4)],
+                'ingredients': [
+                    {'id': j, 'name': f'Ingredient {j}'} for j in range(6)],
+                'description': 'Mix, bake for 20 minutes and serve.',
+                'image': f'{url}{i}/image/?v={i:064x}',
+                'image_renditions': {
+                    size: {'width': 160, 'height': 90,
+                           'webp': f'{url}{i}/image/?size={size}'
+                                   f'&image_format=webp&v={i:064x}',
+                           'jpeg': f'{url}{i}/image/?size={size}'
+                                   f'&image_format=jpeg&v={i:064x}'}
+                    for size in ('thumb', 'medium', 'large')
+                },
+            }
+            for i in range(cls.recipe_count)
+        ]
+
+    def _measure(self, func):
+        # return the best time of a few runs in seconds, and the result
+        best = float('inf')
+        for _ in range(self.runs):
+            start = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - start)
+        return best, result
+
+    @skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_recipe_list_throughput(self):
+        """benchmark rendering and parsing a large recipe list"""
+        stdlib_render, expected = self._measure(
+            lambda: JSONRenderer().render(self.data))
+        fast_render, content = self._measure(
+            lambda: FastJSONRenderer().render(self.data))
+        stdlib_parse, _ = self._measure(
+            lambda: JSONParser().parse(io.BytesIO(content)))
+        fast_parse, parsed = self._measure(
+            lambda: FastJSONParser().parse(io.BytesIO(content)))
+
+        size = len(content) / 1024 / 1024
+        sys.stderr.write(
+            f'\n{self.recipe_count} recipes, {size:.1f}MB: '
+            f'render {size / stdlib_render:.0f}MB/s stdlib, '
+            f'{size / fast_render:.0f}MB/s orjson; '
+            f'parse {size / stdlib_parse:.0f}MB/s stdlib, '
+            f'{size / fast_parse:.0f}MB/s orjson\n')
+        self.assertEqual(content, expected)
+        self.assertEqual(parsed, json.loads(content))
+        self.assertLess(fast_render, stdlib_render / 2)
+        self.assertLess(fast_parse, stdlib_parse)
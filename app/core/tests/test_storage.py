@@ -0,0 +1,233 @@
+"""
+Tests for content-addressed image storage.
+"""
+import hashlib
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, SimpleTestCase, override_settings, tag
+from core.images import render_recipe_image
+from core.models import Recipe, StoredFile, recipe_file_names
+from core.storage import ContentAddressedStorage, content_name
+from core.tests.test_images import image_bytes
+
+
+class StorageTestCase(TestCase):
+    """Store media in a temporary directory"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+
+    def _recipe(self, content=None):
+        # create a recipe, storing an image for it if given
+        recipe = Recipe.objects.create(
+            user=self.user, title='Sample recipe', time_minutes=5,
+            price=Decimal('1.00'))
+        if content is not None:
+            recipe.image.save('photo.jpg', ContentFile(content))
+        return recipe
+
+    def _refs(self, name):
+        # return the reference count of a stored file, or None
+        return StoredFile.objects.filter(name=name).values_list(
+            'refs', flat=True).first()
+
+
+class ContentAddressedStorageTests(StorageTestCase):
+    """Test storing files under a digest of their content"""
+
+    def test_sharded_digest_name(self):
+        """Test files are named after their SHA-256 digest"""
+        storage = ContentAddressedStorage()
+
+        name = storage.save('uploads/recipe/Photo.JPG', ContentFile(b'abc'))
+
+        digest = hashlib.sha256(b'abc').hexdigest()
+        self.assertEqual(
+            name, f'uploads/recipe/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        with storage.open(name) as stored:
+            self.assertEqual(stored.read(), b'abc')
+
+    def test_identical_content_stored_once(self):
+        """Test saving the same content again reuses the stored file"""
+        storage = ContentAddressedStorage()
+
+        first = storage.save('uploads/recipe/a.jpg', ContentFile(b'abc'))
+        second = storage.save('uploads/recipe/b.jpg', ContentFile(b'abc'))
+        other = storage.save('uploads/recipe/c.jpg', ContentFile(b'abd'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        files = [
+            name for _, _, names in os.walk(storage.path('uploads'))
+            for name in names
+        ]
+        self.assertEqual(len(files), 2)
+
+
+class StoredFileTests(StorageTestCase):
+    """Test counting the recipes using each stored file"""
+
+    def test_shared_file_counted(self):
+        """Test recipes with identical images share one counted file"""
+        content = image_bytes((20, 20))
+        first = self._recipe(content)
+        second = self._recipe(content)
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self._refs(first.image.name), 2)
+
+    @override_settings(RECIPE_IMAGE_DELETE_DELAY=0)
+    def test_file_deleted_with_last_reference(self):
+        """Test a file is only deleted once no recipe uses it"""
+        content = image_bytes((20, 20))
+        first = self._recipe(content)
+        second = self._recipe(content)
+        path = first.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self._refs(second.image.name), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(self._refs(second.image.name))
+
+    def test_recent_file_kept(self):
+        """Test unused files stored within the delete delay are kept"""
+        recipe = self._recipe(image_bytes((20, 20)))
+        name = recipe.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+        self.assertTrue(recipe.image.storage.exists(name))
+        self.assertEqual(self._refs(name), 0)
+
+    @override_settings(RECIPE_IMAGE_DELETE_DELAY=0)
+    def test_replaced_image_released(self):
+        """Test replacing an image releases the old file and renditions"""
+        recipe = self._recipe(image_bytes((20, 20)))
+        render_recipe_image(recipe)
+        old_names = Counter(recipe_file_names(
+            recipe.image.name, recipe.image_renditions))
+        # an image too small to resize has identical renditions
+        self.assertEqual(len(old_names), 3)
+        self.assertEqual(
+            {name: self._refs(name) for name in old_names}, old_names)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image_renditions = {}
+            recipe.image.save(
+                'photo.jpg', ContentFile(image_bytes((20, 20), color='blue')))
+
+        self.assertEqual(self._refs(recipe.image.name), 1)
+        for name in old_names:
+            self.assertIsNone(self._refs(name))
+            self.assertFalse(recipe.image.storage.exists(name))
+
+
+@tag('benchmark')
+class StorageBenchmark(SimpleTestCase):
+    """Measure upload throughput and lookups among a million files"""
+
+    file_count = 1000000
+    upload_count = 200
+    upload_size = 512 * 1024
+    lookups = 10000
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def _throughput(self, storage):
+        # return the MB/s of saving uploads in a storage
+        uploads = [os.urandom(self.upload_size)
+                   for _ in range(self.upload_count)]
+        start = time.perf_counter()
+        for content in uploads:
+            storage.save('uploads/recipe/photo.jpg', ContentFile(content))
+        elapsed = time.perf_counter() - start
+        return self.upload_count * self.upload_size / elapsed / 1e6
+
+    def _populate(self, paths):
+        # create empty files, making directories as needed
+        for path in paths:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_WRONLY))
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(path))
+                os.close(os.open(path, os.O_CREAT | os.O_WRONLY))
+
+    def _lookups(self, paths):
+        # return the median microseconds of stat on existing and missing
+        # paths, as storage.exists does
+        timings = []
+        for path in random.sample(paths, self.lookups):
+            start = time.perf_counter()
+            os.path.exists(path)
+            os.path.exists(path + '.missing')
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) / 2 * 1e6
+
+    def _listing(self, directory):
+        # return the milliseconds to list a directory
+        start = time.perf_counter()
+        with os.scandir(directory) as entries:
+            for _ in entries:
+                pass
+        return (time.perf_counter() - start) * 1000
+
+    def test_storage_at_scale(self):
+        """benchmark uploads, and lookups among a million stored files"""
+        flat_mbs = self._throughput(
+            FileSystemStorage(os.path.join(self.root, 'flat')))
+        sharded_mbs = self._throughput(
+            ContentAddressedStorage(os.path.join(self.root, 'sharded')))
+
+        flat_dir = os.path.join(self.root, 'flat', 'many')
+        os.makedirs(flat_dir)
+        flat = [os.path.join(flat_dir, f'{uuid.uuid4()}.jpg')
+                for _ in range(self.file_count)]
+        self._populate(flat)
+        sharded = [
+            os.path.join(self.root, 'sharded', content_name(
+                'many', hashlib.sha256(str(i).encode()).hexdigest(), '.jpg'))
+            for i in range(self.file_count)
+        ]
+        self._populate(sharded)
+
+        results = {
+            'flat': (self._lookups(flat), self._listing(flat_dir)),
+            'sharded': (
+                self._lookups(sharded),
+                self._listing(os.path.dirname(sharded[0]))),
+        }
+        sys.stderr.write(
+            f'\nupload of {self.upload_count} x '
+            f'{self.upload_size // 1024}kB: {flat_mbs:.0f}MB/s uuid names, '
+            f'{sharded_mbs:.0f}MB/s content addressed\n' + ''.join(
+                f'{layout} layout of {self.file_count} files: '
+                f'{lookup:.1f}us per lookup, '
+                f'{listing:.1f}ms to list the directory of a file\n'
+                for layout, (lookup, listing) in results.items()
+            ))
+        self.assertLess(results['sharded'][1], results['flat'][1] / 100)
@@ -0,0 +1,98 @@
+"""
+Tests for streaming image uploads.
+"""
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+from django.http.multipartparser import MultiPartParser
+from django.test import SimpleTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from core.tests.test_images import image_bytes
+from core.uploads import ImageUploadHandler, image_format, image_size
+
+
+class ImageHeaderTests(SimpleTestCase):
+    """Test reading images from their first bytes"""
+
+    def test_formats(self):
+        """Test formats are recognised by their signature"""
+        for fmt in ('JPEG', 'PNG', 'GIF', 'WEBP'):
+            self.assertEqual(image_format(image_bytes((10, 10), fmt)), fmt)
+        self.assertIsNone(image_format(b'<svg xmlns="http://www.w3.org'))
+
+    def test_sizes(self):
+        """Test dimensions are read as Pillow reads them"""
+        for fmt, params in (
+            ('JPEG', {}),
+            ('PNG', {}),
+            ('GIF', {}),
+            ('WEBP', {}),
+            ('WEBP', {'lossless': True}),
+            ('WEBP', {'mode': 'RGBA', 'color': (255, 0, 0, 128)}),
+        ):
+            content = image_bytes((300, 170), fmt, **params)
+            with Image.open(io.BytesIO(content)) as image:
+                self.assertEqual(image.size, (300, 170))
+            self.assertEqual(image_size(content, fmt), (300, 170))
+
+    def test_partial_header(self):
+        """Test more bytes are asked for until the dimensions are read"""
+        content = image_bytes((300, 170), exif=b'Exif\x00\x00' + bytes(2000))
+
+        self.assertIsNone(image_size(content[:200], 'JPEG'))
+        self.assertEqual(image_size(content, 'JPEG'), (300, 170))
+
+
+@override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=20 * 1024 * 1024)
+class UploadMemoryTests(SimpleTestCase):
+    """Measure the memory held while parsing an image upload"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # a photo sized upload, small enough to be kept in memory by the
+        # default handlers
+        noise = Image.frombytes('RGB', (850, 850), os.urandom(850 * 850 * 3))
+        buffer = io.BytesIO()
+        noise.save(buffer, 'PNG')
+        self.size = buffer.tell()
+        self.body = encode_multipart(BOUNDARY, {
+            'image': SimpleUploadedFile('photo.png', buffer.getvalue()),
+        })
+
+    def _peak(self, handlers):
+        # return the most memory allocated while parsing the upload
+        meta = {
+            'CONTENT_TYPE': MULTIPART_CONTENT,
+            'CONTENT_LENGTH': str(len(self.body)),
+        }
+        stream = io.BytesIO(self.body)
+        tracemalloc.start()
+        try:
+            _, files = MultiPartParser(meta, stream, handlers).parse()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(files['image'].size, self.size)
+        files['image'].close()
+        return peak
+
+    def test_upload_memory_bounded(self):
+        """Test uploads are streamed to disk rather than held in memory"""
+        default = self._peak(
+            [MemoryFileUploadHandler(), TemporaryFileUploadHandler()])
+        streamed = self._peak([ImageUploadHandler()])
+
+        self.assertGreater(default, self.size)
+        self.assertLess(streamed, 512 * 1024)
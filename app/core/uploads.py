@@ -0,0 +1,161 @@
+"""
+Streaming upload handling for recipe images.
+
+ImageUploadHandler writes an uploaded image straight to a temporary file
+on the media volume, so storing it is a rename rather than a copy, and
+refuses it as early as possible: before reading the body when its length
+is too large, and from its first bytes when it is not an accepted image
+or declares too many pixels to decode safely. Only those first bytes are
+held in memory.
+"""
+import io
+import os
+import tempfile
+import warnings
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+
+# leading bytes of each accepted image format
+IMAGE_SIGNATURES = {
+    'JPEG': (b'\xff\xd8\xff',),
+    'PNG': (b'\x89PNG\r\n\x1a\n',),
+    'GIF': (b'GIF87a', b'GIF89a'),
+}
+
+# most bytes read looking for the dimensions of an image, which may follow
+# large metadata segments
+HEADER_LIMIT = 1024 * 1024
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload too large.'
+    default_code = 'upload_too_large'
+
+
+def image_format(head):
+    """Return the format the first bytes of an image belong to, or None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    for fmt, signatures in IMAGE_SIGNATURES.items():
+        if head.startswith(signatures):
+            return fmt
+    return None
+
+
+def _webp_size(head):
+    # read the canvas size from a WebP header, or None if it is incomplete;
+    # Pillow only opens complete WebP files
+    chunk = head[12:16]
+    if chunk == b'VP8X' and len(head) >= 30:
+        return (1 + int.from_bytes(head[24:27], 'little'),
+                1 + int.from_bytes(head[27:30], 'little'))
+    if chunk == b'VP8 ' and len(head) >= 30:
+        return (int.from_bytes(head[26:28], 'little') & 0x3fff,
+                int.from_bytes(head[28:30], 'little') & 0x3fff)
+    if chunk == b'VP8L' and len(head) >= 25:
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3fff) + 1, (bits >> 14 & 0x3fff) + 1
+    if len(head) >= 30:
+        raise ValueError('Unknown WebP encoding')
+    return None
+
+
+def image_size(head, fmt):
+    """Return the dimensions declared by the first bytes of an image.
+
+    Returns None while more bytes are needed. Raises ValueError for an
+    image that cannot be read.
+    """
+    if fmt == 'WEBP':
+        return _webp_size(head)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(head), formats=[fmt]) as image:
+                return image.size
+    except Image.DecompressionBombError:
+        raise ValueError('Image too large to decode')
+    except OSError:
+        return None
+
+
+class MediaTemporaryUploadedFile(TemporaryUploadedFile):
+    """Uploaded file written to a temporary file in a given directory."""
+
+    def __init__(self, name, content_type, size, charset, directory,
+                 content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        os.makedirs(directory, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(
+            prefix='.', suffix='.upload' + ext, dir=directory)
+        UploadedFile.__init__(
+            self, file, name, content_type, size, charset, content_type_extra)
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Stream an uploaded image to the media volume, checking it on arrival.
+
+    Uploads larger than RECIPE_IMAGE_MAX_UPLOAD_SIZE get a 413, files that
+    are not JPEG, PNG, GIF or WebP images, or that declare more than
+    RECIPE_IMAGE_MAX_PIXELS pixels, a 400.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = MediaTemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            os.path.join(settings.MEDIA_ROOT, 'tmp'),
+            self.content_type_extra)
+        self.head = b''
+
+    def _check_head(self, complete):
+        # refuse the upload once its first bytes show it is no image, or
+        # too large a one; stop buffering once they show it is fine
+        fmt = image_format(self.head)
+        if fmt is None:
+            if complete or len(self.head) >= 12:
+                raise ValidationError({self.field_name: [
+                    'Upload a JPEG, PNG, GIF or WebP image.']})
+            return
+        try:
+            size = image_size(self.head, fmt)
+        except ValueError as exc:
+            raise ValidationError({self.field_name: [str(exc)]})
+        if size is None:
+            if complete or len(self.head) >= HEADER_LIMIT:
+                raise ValidationError({self.field_name: [
+                    'Upload a valid image.']})
+            return
+        width, height = size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise ValidationError({self.field_name: [
+                f'Images may have at most '
+                f'{settings.RECIPE_IMAGE_MAX_PIXELS} pixels.']})
+        self.head = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+            raise UploadTooLarge()
+        if self.head is not None:
+            self.head += raw_data[:HEADER_LIMIT - len(self.head)]
+            self._check_head(complete=False)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.head is not None:
+            self._check_head(complete=True)
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
@@ -0,0 +1,30 @@
+"""
+Newline-delimited JSON exports of recipes.
+"""
+from itertools import islice
+
+from django.conf import settings
+
+from core.renderers import NDJSONRenderer
+from recipe.representations import recipe_columns, represent_recipes
+from recipe.serializers import RecipeDetailSerializer
+
+
+def export_lines(queryset, context):
+    """Yield one encoded line per recipe, reading recipes in chunks.
+
+    Recipes are read as rows with a server-side cursor and their
+    attributes are read per chunk, so memory stays flat however many are
+    exported.
+    """
+    chunk_size = settings.RECIPE_EXPORT_CHUNK_SIZE
+    rows = queryset.prefetch_related(None).order_by('id').values(
+        *recipe_columns(RecipeDetailSerializer)).iterator(
+        chunk_size=chunk_size)
+    renderer = NDJSONRenderer()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from renderer.render_lines(
+            represent_recipes(chunk, RecipeDetailSerializer, context))
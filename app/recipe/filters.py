@@ -0,0 +1,40 @@
+"""
+Filtering recipes by the list query parameters.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+
+def params_to_ints(qs):
+    """Convert a comma separated string to a list of integers"""
+    return [int(str_id) for str_id in qs.split(',')]
+
+
+def filter_recipes(queryset, params):
+    """Apply the tags, ingredients, match and search parameters.
+
+    A search annotates each recipe with its rank, which callers may order
+    by.
+    """
+    tags = params.get('tags')
+    ingredients = params.get('ingredients')
+    search = params.get('search')
+    match_all = params.get('match') == 'all'
+    if search:
+        query = SearchQuery(
+            search, search_type='websearch',
+            config=settings.RECIPE_SEARCH_CONFIG)
+        # a double precision rank round-trips exactly through cursors
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField()))
+    if tags:
+        queryset = queryset.with_related(
+            'tags', params_to_ints(tags), match_all)
+
+    if ingredients:
+        queryset = queryset.with_related(
+            'ingredients', params_to_ints(ingredients), match_all)
+
+    return queryset
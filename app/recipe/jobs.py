@@ -0,0 +1,30 @@
+"""
+Background jobs for the recipe APIs.
+"""
+import tempfile
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from core.jobs import job
+from core.models import Recipe
+from recipe.exports import export_lines
+from recipe.filters import filter_recipes
+
+
+@job
+def export_recipes(user_id, params):
+    """Write the user's recipes matching list parameters to a file."""
+    user = get_user_model().objects.get(pk=user_id)
+    queryset = filter_recipes(
+        Recipe.objects.filter(user=user).defer('search_vector'), params)
+    with tempfile.TemporaryFile() as export:
+        for line in export_lines(queryset, {}):
+            export.write(line)
+        export.seek(0)
+        # sent to the owner only, from the job download endpoint
+        name = default_storage.save(
+            f'exports/{uuid.uuid4()}.ndjson', File(export))
+    return {'file': name}
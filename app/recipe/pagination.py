@@ -0,0 +1,212 @@
+"""
+Keyset (cursor) pagination for the recipe APIs.
+"""
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate by seeking past the last row seen instead of using OFFSET.
+
+    The ordering must be unique (end it with an id tiebreaker) so every row
+    has a distinct position. Deep pages cost the same as the first page
+    and no COUNT(*) query is ever issued.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = _('Invalid cursor')
+    ordering = ('-id',)
+    # names of the facet counts a view may add under a facets key
+    facets = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        reverse, position = self.decode_cursor(request, queryset)
+        self.reverse = reverse
+
+        order = self.ordering
+        if reverse:
+            order = [_invert(field) for field in order]
+        queryset = queryset.order_by(*order)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, order))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        return self.page
+
+    def get_page_size(self, request):
+        """Return the requested page size, capped at the maximum"""
+        page_size = api_settings.PAGE_SIZE
+        try:
+            page_size = _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=settings.RECIPE_MAX_PAGE_SIZE,
+            )
+        except (KeyError, ValueError):
+            pass
+        return min(page_size, settings.RECIPE_MAX_PAGE_SIZE)
+
+    def get_ordering(self, request, queryset, view):
+        """Return the unique ordering the keyset is built on"""
+        if hasattr(view, 'get_keyset_ordering'):
+            return tuple(view.get_keyset_ordering())
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        properties = {
+            'next': {
+                'type': 'string',
+                'nullable': True,
+            },
+            'previous': {
+                'type': 'string',
+                'nullable': True,
+            },
+            'results': schema,
+        }
+        if self.facets:
+            properties['facets'] = {
+                'type': 'object',
+                'description': 'Counts of the requested facets over every '
+                               'matching recipe, most used first',
+                'properties': {
+                    name: {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'id': {'type': 'integer'},
+                                'name': {'type': 'string'},
+                                'count': {'type': 'integer'},
+                            },
+                        },
+                    }
+                    for name in self.facets
+                },
+            }
+        return {
+            'type': 'object',
+            'properties': properties,
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page, '
+                               f'at most {settings.RECIPE_MAX_PAGE_SIZE}.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def decode_cursor(self, request, queryset):
+        """Return a (reverse, position) pair from the request cursor"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+
+        try:
+            reverse, position = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii')))
+            reverse = bool(reverse)
+            position = list(position)
+            if len(position) != len(self.ordering):
+                raise ValueError('Wrong number of position values')
+            position = [
+                _ordering_field(queryset, field).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+            if None in position:
+                raise ValueError('Null position value')
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, position
+
+    def encode_cursor(self, reverse, instance):
+        """Return a URL pointing at the rows on one side of an instance"""
+        position = [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+        encoded = urlsafe_b64encode(
+            json.dumps([int(reverse), position]).encode('ascii')
+        ).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
+
+    def _after(self, position, order):
+        """Build the filter selecting rows strictly after a position"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(order, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+
+def _ordering_field(queryset, field):
+    # return the model field or annotation an ordering field sorts by
+    name = field.lstrip('-')
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _invert(field):
+    # flip the direction of an ordering field
+    return field[1:] if field.startswith('-') else f'-{field}'
@@ -0,0 +1,82 @@
+"""
+Read-only rendering of recipes without serializer instances.
+
+RecipeSerializer and RecipeDetailSerializer build a field tree per call
+and walk it for every recipe, model instance and prefetched attribute.
+The functions here produce the same output from .values() rows and one
+query per attribute kind, which is what the list and export views send.
+Test parity with the serializers when changing either side.
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from core.models import Recipe
+from recipe.serializers import (
+    image_action_url,
+    image_url,
+    rendition_urls,
+)
+
+# many-to-many fields rendered as lists of {'id', 'name'}
+ATTR_FIELDS = ('tags', 'ingredients')
+
+_price = Recipe._meta.get_field('price')
+PRICE_FIELD = serializers.DecimalField(
+    max_digits=_price.max_digits, decimal_places=_price.decimal_places)
+
+
+def recipe_columns(serializer_class):
+    """Return the recipe columns read to render serializer_class output."""
+    return [name for name in serializer_class.Meta.fields
+            if name not in ATTR_FIELDS]
+
+
+def _attr_map(related, ids):
+    # map recipe ids to the {'id', 'name'} of their attributes, by id
+    source = related.field.m2m_field_name() + '_id'
+    target = related.field.m2m_reverse_field_name()
+    links = related.through.objects.filter(**{source + '__in': ids}).order_by(
+        target + '_id').values_list(source, target + '_id', target + '__name')
+    attrs = defaultdict(list)
+    for recipe_id, pk, name in links:
+        attrs[recipe_id].append({'id': pk, 'name': name})
+    return attrs
+
+
+def represent_recipes(rows, serializer_class, context):
+    """Return serializer_class output for rows of recipe_columns values.
+
+    Tags and ingredients are read for all the rows at once. The result is
+    in the order of the rows.
+    """
+    request = context.get('request')
+    rows = list(rows)
+    ids = [row['id'] for row in rows]
+    attrs = {
+        name: _attr_map(getattr(Recipe, name), ids)
+        for name in serializer_class.Meta.fields if name in ATTR_FIELDS
+    }
+    fields = serializer_class.Meta.fields
+    data = []
+    for row in rows:
+        recipe = {}
+        # the image files of a recipe are all sent by one action
+        action_url = None
+        if row.get('image') or row.get('image_renditions'):
+            action_url = image_action_url(row['id'], request)
+        for name in fields:
+            if name in attrs:
+                recipe[name] = attrs[name].get(row['id'], [])
+            elif name == 'price':
+                recipe[name] = PRICE_FIELD.to_representation(row[name])
+            elif name == 'image':
+                recipe[name] = (image_url(action_url, row[name])
+                                if row[name] else None)
+            elif name == 'image_renditions':
+                recipe[name] = (rendition_urls(action_url, row[name])
+                                if row[name] else {})
+            else:
+                recipe[name] = row[name]
+        data.append(recipe)
+    return data
@@ -1,9 +1,35 @@
 # Serializers for recipe APIs
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import models
+from django.urls import reverse
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
-from core.models import Recipe, Tag, Ingredient
+from core.cache import bump_user_version
+from core.images import RENDITION_FORMATS
+from core.media import media_version
+from core.models import Job, Recipe, Tag, Ingredient
+
+
+class RecipeAttrSerializer(serializers.ModelSerializer):
+    # base serializer for tags and ingredients
 
+    def validate_name(self, value):
+        # names are unique per user; only checked when renaming
+        if self.instance is None:
+            return value
+        user = self.context['request'].user
+        if self.Meta.model.objects.filter(user=user, name=value).exclude(
+                pk=self.instance.pk).exists():
+            raise serializers.ValidationError(
+                f'A {self.Meta.model._meta.verbose_name} with this name '
+                'already exists.')
+        return value
 
-class TagSerializer(serializers.ModelSerializer):
+
+class TagSerializer(RecipeAttrSerializer):
     # serializer for tag objects
     class Meta:
         model = Tag
@@ -11,7 +37,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(RecipeAttrSerializer):
     # serializer for ingredients
     class Meta:
         model = Ingredient
@@ -19,6 +45,59 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    # serializer for creating many recipes at once
+
+    def validate(self, attrs):
+        # limit the number of recipes created by one request
+        if len(attrs) > settings.RECIPE_BULK_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'At most {settings.RECIPE_BULK_MAX_SIZE} recipes '
+                'can be created at once.')
+        return attrs
+
+    def _add_related(self, related, model, recipes, items):
+        # resolve names across the batch and insert all through rows at once
+        user = self.context['request'].user
+        objs = model.objects.get_or_create_many(
+            user, [attr['name'] for attrs in items for attr in attrs])
+        by_name = {obj.name: obj for obj in objs}
+
+        through = related.through
+        source = related.field.m2m_field_name() + '_id'
+        target = related.field.m2m_reverse_field_name() + '_id'
+        links = {
+            (recipe.pk, by_name[attr['name']].pk)
+            for recipe, attrs in zip(recipes, items) for attr in attrs
+        }
+        through.objects.bulk_create([
+            through(**{source: recipe_pk, target: attr_pk})
+            for recipe_pk, attr_pk in sorted(links)
+        ])
+        # the recipes are new, so every link is new to its attribute
+        model.objects.adjust_recipe_count(
+            Counter(attr_pk for recipe_pk, attr_pk in links))
+
+    def create(self, validated_data):
+        # create the recipes with a fixed number of queries
+        tags = [attrs.pop('tags', []) for attrs in validated_data]
+        ingredients = [
+            attrs.pop('ingredients', []) for attrs in validated_data]
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(**attrs) for attrs in validated_data])
+
+        self._add_related(Recipe.tags, Tag, recipes, tags)
+        self._add_related(
+            Recipe.ingredients, Ingredient, recipes, ingredients)
+        created = Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes])
+        # bulk inserts send no signals, so index the batch in one statement
+        created.update_search_vector()
+        bump_user_version(self.context['request'].user)
+
+        return list(created.order_by('id').with_attrs())
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     # serializer for recipes
     tags = TagSerializer(many=True, required=False)
@@ -29,34 +108,36 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'time_minutes',
                   'price', 'link', 'tags', 'ingredients']
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
 
-    def _get_or_create_tags(self, tags, recipe):
+    def _get_or_create_tags(self, tags):
         # handle getting or creating tags as needed
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
-
-    def _get_or_create_ingredients(self, ingredients, recipe):
+        return Tag.objects.get_or_create_many(
+            auth_user, [tag['name'] for tag in tags])
+
+    def _get_or_create_ingredients(self, ingredients):
         """ handle getting or creating ingredients as needed """
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
+        return Ingredient.objects.get_or_create_many(
+            auth_user, [ingredient['name'] for ingredient in ingredients])
+
+    def _sync_related(self, manager, objs):
+        # only delete removed and insert added through-table rows
+        current = {obj.pk for obj in manager.all()}
+        wanted = {obj.pk for obj in objs}
+        manager.remove(*(current - wanted))
+        manager.add(*(wanted - current))
 
     def create(self, validated_data):
         # create a recipe.
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
         recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags, recipe)
-        self._get_or_create_ingredients(ingredients, recipe)
+        recipe.tags.add(*self._get_or_create_tags(tags))
+        recipe.ingredients.add(
+            *self._get_or_create_ingredients(ingredients))
+        bump_user_version(self.context['request'].user)
         return recipe
 
     def update(self, instance, validated_date):
@@ -64,31 +145,130 @@ class RecipeSerializer(serializers.ModelSerializer):
         tags = validated_date.pop('tags', None)
         ingredients = validated_date.pop('ingredients', None)
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            self._sync_related(
+                instance.tags, self._get_or_create_tags(tags))
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            self._sync_related(
+                instance.ingredients,
+                self._get_or_create_ingredients(ingredients))
 
-        for attr, value in validated_date.items():
-            setattr(instance, attr, value)
+        changed = [
+            attr for attr, value in validated_date.items()
+            if getattr(instance, attr) != value
+        ]
+        for attr in changed:
+            setattr(instance, attr, validated_date[attr])
 
-        instance.save()
+        if changed:
+            instance.save(update_fields=changed + ['updated_at'])
+        bump_user_version(self.context['request'].user)
         return instance
 
 
+def image_action_url(recipe_id, request=None):
+    """Return the URL of the action sending the image files of a recipe.
+
+    Files are only sent there, after checking the recipe belongs to the
+    user. The URL is absolute given a request.
+    """
+    url = reverse('recipe:recipe-image', args=[recipe_id])
+    if request is not None:
+        url = request.build_absolute_uri(url)
+    return url
+
+
+def image_url(action_url, name, **params):
+    """Return the URL sending a recipe image file from its action URL.
+
+    The URL names the file version, so clients may keep the file until the
+    URL changes.
+    """
+    params['v'] = media_version(name)
+    return f'{action_url}?{urlencode(params)}'
+
+
+def rendition_urls(action_url, renditions):
+    """Return the sizes and URLs of recipe image renditions by size."""
+    data = {}
+    for size, rendition in renditions.items():
+        data[size] = {
+            'width': rendition['width'],
+            'height': rendition['height'],
+        }
+        for fmt in RENDITION_FORMATS:
+            data[size][fmt] = image_url(
+                action_url, rendition[fmt], size=size, image_format=fmt)
+    return data
+
+
+class RecipeImageField(serializers.ImageField):
+    # a recipe image, represented by the URL of the image action
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return image_url(image_action_url(
+            value.instance.pk, self.context.get('request')), value.name)
+
+
+@extend_schema_field({
+    'type': 'object',
+    'additionalProperties': {
+        'type': 'object',
+        'properties': {
+            'width': {'type': 'integer'},
+            'height': {'type': 'integer'},
+            **{fmt: {'type': 'string', 'format': 'uri'}
+               for fmt in RENDITION_FORMATS},
+        },
+    },
+})
+class ImageRenditionsField(serializers.Field):
+    # resized copies of a recipe image, with a URL for each format
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image_renditions:
+            return {}
+        return rendition_urls(image_action_url(
+            recipe.pk, self.context.get('request')), recipe.image_renditions)
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     # serializer for recipe detail view
+    serializer_field_mapping = {
+        **RecipeSerializer.serializer_field_mapping,
+        models.ImageField: RecipeImageField,
+    }
+    image_renditions = ImageRenditionsField()
+
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'image_renditions']
         read_only_fields = RecipeSerializer.Meta.read_only_fields
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     # serializer for uploading images to recipes
+    serializer_field_mapping = RecipeDetailSerializer.serializer_field_mapping
+    image_renditions = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'image_renditions']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+
+class JobSerializer(serializers.ModelSerializer):
+    # serializer for background jobs
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'result', 'created_at',
+                  'finished_at']
+        read_only_fields = fields
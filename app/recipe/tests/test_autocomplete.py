@@ -0,0 +1,131 @@
+"""
+Tests for the tag and ingredient autocomplete APIs.
+"""
+from decimal import Decimal
+from unittest import skipUnless
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient
+
+
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+
+
+class AutocompleteApiTests(TestCase):
+    """Test suggesting tag and ingredient names"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def _suggest(self, url=TAGS_AUTOCOMPLETE_URL, **params):
+        # return the suggested names for the parameters
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data]
+
+    def _use(self, attr, times):
+        # attach the attribute to a number of new recipes
+        for i in range(times):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price=Decimal('1.00'))
+            recipe.tags.add(attr)
+
+    def test_prefix_ordered_by_usage(self):
+        """test prefix suggestions put the most used names first"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self._use(Tag.objects.create(user=self.user, name='Vegetarian'), 2)
+        Tag.objects.create(user=self.user, name='Dessert')
+        Tag.objects.create(user=self.user, name='vegan')
+
+        self.assertEqual(self._suggest(prefix='Veg'), ['Vegetarian', 'Vegan'])
+
+    def test_q_matches_typos_and_substrings(self):
+        """test q suggests similar and containing names"""
+        Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Quick breakfast')
+        Tag.objects.create(user=self.user, name='Dinner')
+
+        self.assertEqual(
+            self._suggest(q='breakfst'), ['Breakfast', 'Quick breakfast'])
+        self.assertEqual(self._suggest(q='inne'), ['Dinner'])
+
+    def test_q_ranked_by_similarity_then_usage(self):
+        """test closer names rank first and ties go to the most used"""
+        Tag.objects.create(user=self.user, name='Spicy food')
+        self._use(Tag.objects.create(user=self.user, name='Food'), 1)
+        self._use(Tag.objects.create(user=self.user, name='FOOD'), 3)
+
+        self.assertEqual(
+            self._suggest(q='food'), ['FOOD', 'Food', 'Spicy food'])
+
+    def test_limit(self):
+        """test the number of suggestions is limited and capped"""
+        for i in range(12):
+            Tag.objects.create(user=self.user, name=f'Tag {i:02}')
+
+        self.assertEqual(len(self._suggest(prefix='Tag')), 10)
+        self.assertEqual(len(self._suggest(prefix='Tag', limit=3)), 3)
+        with override_settings(RECIPE_AUTOCOMPLETE_MAX_LIMIT=5):
+            self.assertEqual(len(self._suggest(prefix='Tag', limit=50)), 5)
+
+    def test_invalid_requests(self):
+        """test a search term and a valid limit are required"""
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'a', 'limit': 0})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_limited_to_user(self):
+        """test other users' names are never suggested"""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        Tag.objects.create(user=other, name='Vegan')
+
+        self.assertEqual(self._suggest(q='vegan'), [])
+
+    def test_ingredients(self):
+        """test ingredients get suggestions from the same endpoint"""
+        Ingredient.objects.create(user=self.user, name='Tomato')
+        Ingredient.objects.create(user=self.user, name='Potato')
+
+        self.assertEqual(
+            self._suggest(INGREDIENTS_AUTOCOMPLETE_URL, q='tomatoe'),
+            ['Tomato'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans need Postgres')
+    def test_uses_indexes(self):
+        """test prefix and q lookups are answered from the name indexes"""
+        Ingredient.objects.bulk_create([
+            Ingredient(user=self.user, name=f'Ingredient {i}')
+            for i in range(5000)
+        ])
+        Ingredient.objects.create(user=self.user, name='Saffron')
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Ingredient._meta.db_table}')
+
+        # trigrams and, under C collation, the unique (user, name) index
+        # answer prefixes too
+        for params, indexes in (
+            ({'prefix': 'Saf'},
+             r'ingredient_name_(prefix|trgm)_idx|unique_ingredient_user_name'),
+            ({'q': 'safron'}, r'ingredient_name_trgm_idx'),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(INGREDIENTS_AUTOCOMPLETE_URL, params)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN {ctx.captured_queries[-1]["sql"]}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+            self.assertRegex(plan, indexes)
+            self.assertNotIn('Seq Scan on core_ingredient', plan)
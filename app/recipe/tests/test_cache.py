@@ -0,0 +1,144 @@
+"""
+Tests for the per-user response cache of the recipe APIs.
+"""
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.cache import bump_user_version, cache_stats, get_user_version
+from core.models import Recipe, Tag
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'response-cache-tests',
+    }
+}
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(TestCase):
+    """Test caching recipe, tag and ingredient reads"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_list_cached(self):
+        """test a repeated list is served from the cache"""
+        create_recipe(self.user)
+        first = self.client.get(RECIPES_URL)
+
+        # only the id/timestamp page used to build the ETag is queried
+        with self.assertNumQueries(1):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_query_params_normalized(self):
+        """test query parameter order does not change the cache key"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(f'{RECIPES_URL}?tags={tag.id}&page_size=5')
+
+        res = self.client.get(f'{RECIPES_URL}?page_size=5&tags={tag.id}')
+        other = self.client.get(RECIPES_URL, {'tags': tag.id})
+
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(other['X-Cache'], 'MISS')
+
+    def test_create_invalidates(self):
+        """test creating a recipe invalidates cached lists"""
+        self.client.get(RECIPES_URL)
+        payload = {'title': 'New', 'time_minutes': 5, 'price': '1.00'}
+        self.client.post(RECIPES_URL, payload)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_update_invalidates_detail(self):
+        """test updating a recipe invalidates its cached detail"""
+        recipe = create_recipe(self.user)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+        self.client.get(url)
+        self.client.patch(url, {'title': 'Changed'})
+
+        res = self.client.get(url)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['title'], 'Changed')
+
+    def test_delete_invalidates(self):
+        """test deleting a recipe invalidates cached lists"""
+        recipe = create_recipe(self.user)
+        self.client.get(RECIPES_URL)
+        self.client.delete(reverse('recipe:recipe-detail', args=[recipe.id]))
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_tag_update_invalidates_recipes(self):
+        """test renaming a tag invalidates cached recipe lists"""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        self.client.get(RECIPES_URL)
+        self.client.patch(reverse('recipe:tag-detail', args=[tag.id]),
+                          {'name': 'Vegetarian'})
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            res.data['results'][0]['tags'][0]['name'], 'Vegetarian')
+
+    def test_cache_per_user(self):
+        """test users never see each other's cached responses"""
+        create_recipe(self.user)
+        self.client.get(TAGS_URL)
+        self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_bump_repeated_on_commit(self):
+        """test a write in a transaction invalidates again on commit"""
+        before = get_user_version(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_user_version(self.user)
+            # a read here sees the version of uncommitted data
+            during = get_user_version(self.user)
+
+        self.assertGreater(during, before)
+        self.assertGreater(get_user_version(self.user), during)
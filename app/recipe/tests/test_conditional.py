@@ -0,0 +1,144 @@
+"""
+Tests for conditional GET requests on the recipe API.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return the recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ConditionalRequestTests(TestCase):
+    """Test ETag and Last-Modified handling"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(self.user)
+
+    def test_updated_at_bumped_on_tag_change(self):
+        """test changing recipe tags bumps its modification time"""
+        before = self.recipe.updated_at
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.updated_at, before)
+
+    def test_updated_at_bumped_on_tag_rename(self):
+        """test renaming a tag bumps the recipes using it"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe.tags.add(tag)
+        self.recipe.refresh_from_db()
+        before = self.recipe.updated_at
+
+        tag.name = 'Vegetarian'
+        tag.save()
+
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.updated_at, before)
+
+    def test_retrieve_if_none_match(self):
+        """test a matching ETag returns not modified"""
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertIn('ETag', res)
+
+        res = self.client.get(detail_url(self.recipe.id),
+                              HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_retrieve_etag_changes_on_update(self):
+        """test updating a recipe changes its ETag"""
+        etag = self.client.get(detail_url(self.recipe.id))['ETag']
+        self.client.patch(detail_url(self.recipe.id), {'title': 'New title'})
+
+        res = self.client.get(detail_url(self.recipe.id),
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_retrieve_if_modified_since(self):
+        """test If-Modified-Since compares with the recipe timestamp"""
+        url = detail_url(self.recipe.id)
+        future = http_date((timezone.now() + timedelta(hours=1)).timestamp())
+        past = http_date((timezone.now() - timedelta(hours=1)).timestamp())
+
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=future).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=past).status_code,
+            status.HTTP_200_OK,
+        )
+
+    def test_list_if_none_match(self):
+        """test an unchanged list returns not modified"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_changes_on_delete(self):
+        """test deleting a recipe changes the list ETag"""
+        create_recipe(self.user, title='Other')
+        etag = self.client.get(RECIPES_URL)['ETag']
+        self.client.delete(detail_url(self.recipe.id))
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_etag_depends_on_page(self):
+        """test different pages have different ETags"""
+        create_recipe(self.user, title='Other')
+        first = self.client.get(RECIPES_URL, {'page_size': 1})
+
+        second = self.client.get(first.data['next'])
+
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_cached_body_matches_etag(self):
+        """test a body cached for an older ETag is not sent with a new one"""
+        self.client.get(RECIPES_URL)
+        self.client.get(detail_url(self.recipe.id))
+        # a write whose cache invalidation was lost
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            title='Changed', updated_at=timezone.now() + timedelta(seconds=1))
+
+        for url in (RECIPES_URL, detail_url(self.recipe.id)):
+            res = self.client.get(url)
+
+            data = res.data['results'][0] if 'results' in res.data else res.data
+            self.assertEqual(res['X-Cache'], 'MISS')
+            self.assertEqual(data['title'], 'Changed')
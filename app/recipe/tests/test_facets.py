@@ -0,0 +1,146 @@
+"""
+Tests for facet counts on the recipe list.
+"""
+import json
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    """Return the recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeFacetTests(TestCase):
+    """Test counting tags and ingredients of the filtered recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+        self.salad = create_recipe(self.user, title='Salad')
+        self.salad.tags.add(self.vegan, self.quick)
+        self.curry = create_recipe(self.user, title='Curry')
+        self.curry.tags.add(self.vegan)
+        self.curry.ingredients.add(self.rice)
+        create_recipe(self.user, title='Steak').tags.add(self.quick)
+
+    def _facets(self, **params):
+        # return the facets of a recipe list request
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['facets']
+
+    def test_facets_not_requested(self):
+        """test the list has no facets unless requested"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('facets', res.data)
+
+    def test_facets_counts(self):
+        """test tags and ingredients are counted, most used first"""
+        facets = self._facets(facets='tags,ingredients')
+
+        self.assertEqual(facets['tags'], [
+            {'id': self.quick.id, 'name': 'Quick', 'count': 2},
+            {'id': self.vegan.id, 'name': 'Vegan', 'count': 2},
+        ])
+        self.assertEqual(facets['ingredients'], [
+            {'id': self.rice.id, 'name': 'Rice', 'count': 1},
+        ])
+
+    def test_facets_follow_filters(self):
+        """test counts only cover recipes matching the filters"""
+        facets = self._facets(facets='tags', tags=str(self.vegan.id))
+        self.assertEqual(facets['tags'], [
+            {'id': self.vegan.id, 'name': 'Vegan', 'count': 2},
+            {'id': self.quick.id, 'name': 'Quick', 'count': 1},
+        ])
+
+        facets = self._facets(facets='ingredients', search='salad')
+        self.assertEqual(facets, {'ingredients': []})
+
+    def test_facets_cover_every_page(self):
+        """test counts include recipes beyond the current page"""
+        facets = self._facets(facets='tags', page_size=1)
+
+        self.assertEqual(
+            [tag['count'] for tag in facets['tags']], [2, 2])
+
+    def test_facets_limited_to_user(self):
+        """test other users' recipes are never counted"""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        create_recipe(other).tags.add(
+            Tag.objects.create(user=other, name='Vegan'))
+
+        facets = self._facets(facets='tags')
+
+        self.assertEqual(
+            [tag['id'] for tag in facets['tags']],
+            [self.quick.id, self.vegan.id])
+
+    def test_facets_one_query_each(self):
+        """test each facet is counted with a single aggregate query"""
+        with CaptureQueriesContext(connection) as ctx:
+            self._facets(facets='tags,ingredients')
+
+        counts = [
+            query['sql'] for query in ctx.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+        self.assertEqual(len(counts), 2)
+
+    def test_unknown_facet(self):
+        """test requesting an unknown facet is rejected"""
+        res = self.client.get(RECIPES_URL, {'facets': 'tags,price'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facets_etag_changes_off_page(self):
+        """test changing a recipe on another page changes the ETag"""
+        params = {'facets': 'tags', 'page_size': 1}
+        etag = self.client.get(RECIPES_URL, params)['ETag']
+        self.client.patch(
+            detail_url(self.salad.id), {'tags': []}, format='json')
+
+        res = self.client.get(RECIPES_URL, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['count'] for tag in res.data['facets']['tags']], [1, 1])
+
+    def test_schema_describes_facets(self):
+        """test the recipe list schema documents the facets key"""
+        res = self.client.get(reverse('api-schema'), {'format': 'json'})
+
+        schemas = json.loads(res.content)['components']['schemas']
+        facets = schemas['PaginatedRecipeList']['properties']['facets']
+        self.assertEqual(set(facets['properties']), {'tags', 'ingredients'})
+        self.assertNotIn('facets', schemas['PaginatedTagList']['properties'])
@@ -0,0 +1,135 @@
+"""
+Tests for keyset pagination of the recipe APIs.
+"""
+import json
+from base64 import urlsafe_b64encode
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class KeysetPaginationTests(TestCase):
+    """Test paginating recipe, tag and ingredient lists"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def _walk(self, url, params=None, link='next'):
+        # follow pagination links and return the ids in page order
+        ids = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            page = [item['id'] for item in res.data['results']]
+            ids.extend(page if link == 'next' else reversed(page))
+            if not res.data[link]:
+                return ids
+            res = self.client.get(res.data[link])
+
+    def test_recipe_pages_cover_all_recipes(self):
+        """test following next links returns every recipe once"""
+        recipes = [create_recipe(self.user, title=f'R{i}') for i in range(5)]
+
+        ids = self._walk(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(ids, sorted((r.id for r in recipes), reverse=True))
+
+    def test_previous_link_walks_back(self):
+        """test following previous links from the last page"""
+        recipes = [create_recipe(self.user, title=f'R{i}') for i in range(5)]
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+        last_page = [item['id'] for item in res.data['results']]
+
+        ids = self._walk(res.data['previous'], link='previous')
+
+        expected = sorted((r.id for r in recipes), reverse=True)
+        self.assertEqual(last_page + ids, list(reversed(expected)))
+
+    def test_tags_paginated_by_name(self):
+        """test tags are each returned exactly once in name order"""
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Lunch', 'Dinner', 'Vegan', 'Breakfast')]
+
+        ids = self._walk(TAGS_URL, {'page_size': 1})
+
+        expected = sorted(tags, key=lambda tag: tag.name, reverse=True)
+        self.assertEqual(ids, [tag.id for tag in expected])
+
+    def test_no_count_query(self):
+        """test paginating never counts the full result set"""
+        for i in range(3):
+            create_recipe(self.user, title=f'R{i}')
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPES_URL, {'page_size': 1})
+            self.client.get(res.data['next'])
+
+        for query in ctx.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+
+    @override_settings(RECIPE_MAX_PAGE_SIZE=2)
+    def test_page_size_capped(self):
+        """test requesting a page larger than the cap"""
+        for i in range(3):
+            create_recipe(self.user, title=f'R{i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 100})
+
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNotNone(res.data['next'])
+
+    def test_invalid_cursor(self):
+        """test an invalid cursor returns not found"""
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_invalid_values(self):
+        """test a cursor holding values of the wrong type is not found"""
+        for position in (['abc'], [None], [[1]], [1, 2], {'id': 1}):
+            cursor = urlsafe_b64encode(
+                json.dumps([0, position]).encode()).decode()
+
+            res = self.client.get(RECIPES_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        res = self.client.get(
+            RECIPES_URL, {'search': 'soup', 'cursor': urlsafe_b64encode(
+                b'[0, ["high", 1]]').decode()})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_schema_describes_envelope(self):
+        """test the API schema documents the paginated envelope"""
+        res = self.client.get(reverse('api-schema'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(b'PaginatedRecipeList', res.content)
+        self.assertIn(b'cursor', res.content)
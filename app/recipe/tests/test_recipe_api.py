@@ -2,12 +2,20 @@
 Test the recipe API
 """
 from decimal import Decimal
+import json
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from core.models import Recipe, Tag, Ingredient
+from core.images import RENDITION_FORMATS
+from core.jobs import run_next
+from core.models import Job, Recipe, Tag, Ingredient
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 import tempfile
 import os
@@ -15,6 +23,9 @@ from PIL import Image
 
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk-create')
+EXPORT_URL = reverse('recipe:recipe-export')
+EXPORT_BACKGROUND_URL = reverse('recipe:recipe-export-background')
 
 
 def detail_url(recipe_id):
@@ -22,11 +33,21 @@ def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def job_url(job_id):
+    # return the background job detail URL
+    return reverse('recipe:job-detail', args=[job_id])
+
+
 def image_upload_url(recipe_id):
     # return URL for recipe image upload
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def image_url(recipe_id):
+    # return URL sending a recipe image
+    return reverse('recipe:recipe-image', args=[recipe_id])
+
+
 def create_recipe(user, **params):
     # create and return a sample recipe
     defaults = {
@@ -76,7 +97,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         # test list of recipes is limited to user
@@ -90,7 +111,7 @@ class PrivateRecipeApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         # test get recipe detail
@@ -380,9 +401,9 @@ class PrivateRecipeApiTests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """test filtering recipes by ingredients"""
@@ -401,9 +422,322 @@ class PrivateRecipeApiTests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_by_all_tags(self):
+        """test match=all only returns recipes with every listed tag"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        both = create_recipe(user=self.user, title='Salad')
+        both.tags.add(tag1, tag2)
+        one = create_recipe(user=self.user, title='Stew')
+        one.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id},{tag1.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(
+            [recipe['id'] for recipe in res.data['results']], [both.id])
+
+    def test_filter_by_tags_not_repeated(self):
+        """test recipes matching several tags are listed once"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        recipe = create_recipe(user=self.user, title='Salad')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual(
+            [item['id'] for item in res.data['results']], [recipe.id])
+
+    def _create_recipes_with_attrs(self, count):
+        # create recipes that each have their own tag and ingredient
+        for i in range(count):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {recipe.id}'))
+            recipe.ingredients.add(Ingredient.objects.create(
+                user=self.user, name=f'Ing {recipe.id}'))
+
+    def _count_queries(self, url, params=None):
+        # return the number of queries made when fetching a URL
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_constant(self):
+        """test listing recipes does not query per recipe"""
+        self._create_recipes_with_attrs(1)
+        single = self._count_queries(RECIPES_URL)
+
+        self._create_recipes_with_attrs(10)
+        many = self._count_queries(RECIPES_URL)
+
+        self.assertEqual(single, many)
+
+    def test_filtered_list_query_count_constant(self):
+        """test filtering recipes does not query per recipe"""
+        self._create_recipes_with_attrs(10)
+        tag_ids = [str(pk) for pk in Tag.objects.values_list('id', flat=True)]
+
+        few = self._count_queries(RECIPES_URL, {'tags': tag_ids[0]})
+        many = self._count_queries(RECIPES_URL, {'tags': ','.join(tag_ids)})
+
+        self.assertEqual(few, many)
+
+    def test_retrieve_query_count_constant(self):
+        """test retrieving a recipe does not query per tag/ingredient"""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        single = self._count_queries(detail_url(recipe.id))
+
+        for i in range(10):
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {i}'))
+        many = self._count_queries(detail_url(recipe.id))
+
+        self.assertEqual(single, many)
+
+    def _write_query_count(self, method, url, size):
+        # return the queries used to write a recipe with size tags/ingredients
+        payload = {
+            'title': 'Big recipe',
+            'time_minutes': 30,
+            'price': Decimal('5.00'),
+            'tags': [{'name': f'Tag {url} {i}'} for i in range(size)],
+            'ingredients': [
+                {'name': f'Ing {url} {i}'} for i in range(size)],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            res = getattr(self.client, method)(url, payload, format='json')
+        self.assertIn(res.status_code, (status.HTTP_200_OK,
+                                        status.HTTP_201_CREATED))
+        self.assertEqual(len(res.data['tags']), size)
+        self.assertEqual(len(res.data['ingredients']), size)
+        return len(ctx.captured_queries)
+
+    def test_create_query_count_constant(self):
+        """test creating a recipe costs the same for 1 or 30 attributes"""
+        single = self._write_query_count('post', RECIPES_URL, 1)
+        many = self._write_query_count('post', RECIPES_URL, 30)
+
+        self.assertEqual(single, many)
+
+    def test_update_query_count_constant(self):
+        """test updating a recipe costs the same for 1 or 30 attributes"""
+        url = detail_url(create_recipe(user=self.user).id)
+        single = self._write_query_count('put', url, 1)
+
+        url = detail_url(create_recipe(user=self.user).id)
+        many = self._write_query_count('put', url, 30)
+
+        self.assertEqual(single, many)
+
+    def test_update_unchanged_recipe_writes_nothing(self):
+        """test resending an unchanged recipe issues no writes"""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Salt'))
+        payload = {
+            'title': recipe.title,
+            'price': recipe.price,
+            'tags': [{'name': 'Vegan'}],
+            'ingredients': [{'name': 'Salt'}],
+        }
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for query in ctx.captured_queries:
+            self.assertTrue(query['sql'].startswith('SELECT'), query['sql'])
+
+    def test_update_tags_keeps_unchanged_rows(self):
+        """test updating tags only touches added and removed rows"""
+        recipe = create_recipe(user=self.user)
+        tag_vegan = Tag.objects.create(user=self.user, name='Vegan')
+        tag_lunch = Tag.objects.create(user=self.user, name='Lunch')
+        recipe.tags.add(tag_vegan, tag_lunch)
+        through = Recipe.tags.through.objects.filter(recipe=recipe)
+        kept_row = through.get(tag=tag_vegan).id
+
+        payload = {'tags': [{'name': 'Vegan'}, {'name': 'Dinner'}]}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(through.get(tag=tag_vegan).id, kept_row)
+        self.assertEqual(
+            set(recipe.tags.values_list('name', flat=True)),
+            {'Vegan', 'Dinner'},
+        )
+
+    def _bulk_payload(self, count, shared='Vegan'):
+        # return a bulk create payload sharing a tag between recipes
+        return [{
+            'title': f'Recipe {i}',
+            'time_minutes': 10,
+            'price': '2.50',
+            'tags': [{'name': shared}, {'name': f'{shared} {i}'}],
+            'ingredients': [{'name': f'Salt {shared}'}],
+        } for i in range(count)]
+
+    def test_bulk_create_recipes(self):
+        """test creating many recipes in one request"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        payload = self._bulk_payload(3)
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['title'] for r in res.data],
+                         [r['title'] for r in payload])
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        for recipe in recipes:
+            self.assertEqual(recipe.tags.count(), 2)
+            self.assertEqual(recipe.ingredients.count(), 1)
+        self.assertEqual(
+            Tag.objects.get(user=self.user, name='Vegan').recipe_count, 3)
+        self.assertEqual(
+            Ingredient.objects.get(user=self.user).recipe_count, 3)
+
+    def test_bulk_create_reports_item_errors(self):
+        """test invalid items are reported and nothing is created"""
+        payload = self._bulk_payload(3)
+        del payload[1]['title']
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[1])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    @override_settings(RECIPE_BULK_MAX_SIZE=2)
+    def test_bulk_create_size_limited(self):
+        """test bulk creating more recipes than allowed"""
+        res = self.client.post(BULK_URL, self._bulk_payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_create_schema(self):
+        """test the API schema documents the unpaginated 201 response"""
+        res = self.client.get(reverse('api-schema'), {'format': 'json'})
+
+        operation = json.loads(res.content)['paths'][BULK_URL]['post']
+        self.assertEqual(list(operation['responses']), ['201'])
+        self.assertEqual(
+            operation['responses']['201']['content']['application/json']
+            ['schema']['type'], 'array')
+        self.assertNotIn('parameters', operation)
+
+    def test_bulk_create_query_count_constant(self):
+        """test bulk creating costs the same for 2 or 20 recipes"""
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(
+                BULK_URL, self._bulk_payload(2, 'Few'), format='json')
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(
+                BULK_URL, self._bulk_payload(20, 'Many'), format='json')
+
+        self.assertEqual(len(few.captured_queries),
+                         len(many.captured_queries))
+
+    def _export(self, params=None):
+        # stream an export and return the decoded lines
+        res = self.client.get(EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        content = b''.join(res.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_recipes(self):
+        """test exporting every recipe as newline-delimited JSON"""
+        self._create_recipes_with_attrs(5)
+        create_recipe(user=create_user(email='other@example.com',
+                                       password='testpass123'))
+
+        lines = self._export()
+
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        serializer = RecipeDetailSerializer(recipes, many=True)
+        self.assertEqual(lines, json.loads(json.dumps(serializer.data)))
+
+    def test_export_filter_by_tags(self):
+        """test the export applies the list filters"""
+        r1 = create_recipe(user=self.user, title='Thai vegetable curry')
+        create_recipe(user=self.user, title='Fish and chips')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1.tags.add(tag)
+
+        lines = self._export({'tags': tag.id})
+
+        self.assertEqual([line['id'] for line in lines], [r1.id])
+
+    def test_export_background(self):
+        """test exporting to a file in a background job"""
+        r1 = create_recipe(user=self.user, title='Thai vegetable curry')
+        create_recipe(user=self.user, title='Fish and chips')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1.tags.add(tag)
+
+        res = self.client.post(
+            EXPORT_BACKGROUND_URL + f'?tags={tag.id}')
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data['status'], 'pending')
+        run_next()
+
+        res = self.client.get(job_url(res.data['id']))
+        self.assertEqual(res.data['status'], 'done')
+        name = res.data['result']['file']
+        with default_storage.open(name) as export:
+            lines = [json.loads(line) for line in export]
+        default_storage.delete(name)
+        self.assertEqual([line['id'] for line in lines], [r1.id])
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_export_download(self):
+        """test finished exports are handed to the proxy as attachments"""
+        create_recipe(user=self.user)
+        res = self.client.post(EXPORT_BACKGROUND_URL)
+        download_url = reverse('recipe:job-download', args=[res.data['id']])
+
+        res = self.client.get(download_url)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        name = run_next().result['file']
+        self.addCleanup(default_storage.delete, name)
+        res = self.client.get(download_url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], f'/internal-media/{name}')
+        self.assertEqual(
+            res['Content-Disposition'],
+            'attachment; filename="export_recipes.ndjson"')
+        self.assertIn('no-cache', res['Cache-Control'])
+
+    def test_job_limited_to_user(self):
+        """test users can only see their own jobs"""
+        other = create_user(email='other@example.com', password='pass123')
+        job = Job.objects.create(name='export_recipes', user=other)
+
+        res = self.client.get(job_url(job.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
 
 
 class ImageUploadTests(TestCase):
@@ -417,22 +751,60 @@ class ImageUploadTests(TestCase):
         self.recipe = create_recipe(user=self.user)
 
     def tearDown(self):
+        storage = self.recipe.image.storage
+        for rendition in self.recipe.image_renditions.values():
+            for fmt in RENDITION_FORMATS:
+                storage.delete(rendition[fmt])
         self.recipe.image.delete()
 
-    def test_upload_image(self):
-        """ test uploading an image to recipe"""
+    def _upload(self):
+        # upload a small JPEG to the recipe
         url = image_upload_url(self.recipe.id)
         with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
             img = Image.new('RGB', (10, 10))
             img.save(image_file, format='JPEG')
             image_file.seek(0)
             payload = {'image': image_file}
-            res = self.client.post(url, payload, format='multipart')
+            return self.client.post(url, payload, format='multipart')
+
+    def test_upload_image(self):
+        """ test uploading an image to recipe"""
+        res = self._upload()
 
         self.recipe.refresh_from_db()
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertEqual(res.data['image_renditions'], {})
+        self.assertEqual(res.data['job']['status'], 'pending')
+
+        self.assertEqual(run_next().pk, res.data['job']['id'])
+
+        self.recipe.refresh_from_db()
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(
+            set(res.data['image_renditions']),
+            set(self.recipe.image_renditions))
+        self.assertTrue(res.data['image'].startswith(
+            'http://testserver' + image_url(self.recipe.id) + '?v='))
+        storage = self.recipe.image.storage
+        for size, rendition in self.recipe.image_renditions.items():
+            for fmt in RENDITION_FORMATS:
+                self.assertTrue(storage.exists(rendition[fmt]))
+                self.assertTrue(
+                    res.data['image_renditions'][size][fmt].startswith(
+                        'http://testserver' + image_url(self.recipe.id)))
+
+    @override_settings(RECIPE_IMAGE_RENDITIONS_ASYNC=False)
+    def test_upload_image_inline(self):
+        """ test renditions are made during the upload when not async"""
+        res = self._upload()
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('job', res.data)
+        self.assertIn('webp', res.data['image_renditions']['thumb'])
+        self.assertFalse(Job.objects.exists())
 
     def test_upload_image_bad_request(self):
         """ test uploading invalid image"""
@@ -441,3 +813,114 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_not_an_image(self):
+        """ test files that do not start like an image are refused"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            image_file.write(b'not an image, only pretending' * 100)
+            image_file.seek(0)
+            res = self.client.post(
+                url, {'image': image_file}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['image'], ['Upload a JPEG, PNG, GIF or WebP image.'])
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=50)
+    def test_upload_too_many_pixels(self):
+        """ test images declaring too many pixels are refused"""
+        res = self._upload()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('at most 50 pixels', res.data['image'][0])
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=200)
+    def test_upload_too_large(self):
+        """ test uploads over the size limit get a 413"""
+        res = self._upload()
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_moved_into_place(self):
+        """ test uploads are renamed into place, leaving no copy behind"""
+        self._upload()
+        self.recipe.refresh_from_db()
+
+        tmp_dir = os.path.join(settings.MEDIA_ROOT, 'tmp')
+        self.assertEqual(os.listdir(tmp_dir), [])
+        self.assertEqual(
+            oct(os.stat(self.recipe.image.path).st_mode & 0o777), '0o644')
+
+    @override_settings(RECIPE_IMAGE_RENDITIONS_ASYNC=False,
+                       MEDIA_ACCEL_REDIRECT=True)
+    def test_image_sent_by_proxy(self):
+        """ test images are handed to the proxy with cache headers"""
+        self._upload()
+        self.recipe.refresh_from_db()
+        data = self.client.get(detail_url(self.recipe.id)).data
+
+        res = self.client.get(data['image'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(
+            res['X-Accel-Redirect'], '/internal-media/' + self.recipe.image.name)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+
+        res = self.client.get(data['image'], HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotIn('X-Accel-Redirect', res)
+
+        res = self.client.get(data['image_renditions']['thumb']['jpeg'])
+        self.assertEqual(
+            res['X-Accel-Redirect'],
+            '/internal-media/' + self.recipe.image_renditions['thumb']['jpeg'])
+        self.assertIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=True)
+    def test_image_without_version_revalidated(self):
+        """ test images requested without their version are not kept"""
+        self._upload()
+
+        for params in ({}, {'v': 'stale'}):
+            res = self.client.get(image_url(self.recipe.id), params)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertIn('X-Accel-Redirect', res)
+            self.assertIn('no-cache', res['Cache-Control'])
+            self.assertNotIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_ACCEL_REDIRECT=False)
+    def test_image_streamed_without_proxy(self):
+        """ test images are streamed when not behind the proxy"""
+        self._upload()
+        self.recipe.refresh_from_db()
+
+        res = self.client.get(image_url(self.recipe.id))
+
+        self.assertNotIn('X-Accel-Redirect', res)
+        with open(self.recipe.image.path, 'rb') as image_file:
+            self.assertEqual(b''.join(res.streaming_content), image_file.read())
+
+    def test_image_errors(self):
+        """ test missing, unknown and other users' images are refused"""
+        res = self.client.get(image_url(self.recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        self._upload()
+        res = self.client.get(image_url(self.recipe.id), {'size': 'huge'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        # not rendered yet
+        res = self.client.get(image_url(self.recipe.id), {'size': 'thumb'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        other = create_user(email='other@example.com', password='pass123')
+        self.client.force_authenticate(other)
+        res = self.client.get(image_url(self.recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
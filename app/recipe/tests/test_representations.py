@@ -0,0 +1,165 @@
+"""
+Test rendering recipes from rows matches the serializers
+"""
+import sys
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.representations import recipe_columns, represent_recipes
+from recipe.serializers import RecipeDetailSerializer, RecipeSerializer
+
+
+def renditions(digest):
+    # return image renditions as stored by core.images.create_renditions
+    return {
+        'thumb': {'width': 160, 'height': 90,
+                  'webp': f'uploads/recipe/{digest}-thumb.webp',
+                  'jpeg': f'uploads/recipe/{digest}-thumb.jpg'},
+        'medium': {'width': 640, 'height': 360,
+                   'webp': f'uploads/recipe/{digest}-medium.webp',
+                   'jpeg': f'uploads/recipe/{digest}-medium.jpg'},
+    }
+
+
+class RecipeRepresentationTests(TestCase):
+    """Test recipes rendered from rows match serializer output"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        tags = [Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Dinner', 'Crème brûlée')]
+        ingredients = [Ingredient.objects.create(user=self.user, name=name)
+                       for name in ('Kale', 'Salt')]
+
+        plain = Recipe.objects.create(
+            user=self.user, title='Plain', time_minutes=5,
+            price=Decimal('5'))
+        full = Recipe.objects.create(
+            user=self.user, title='Curry "special" ☃', time_minutes=45,
+            price=Decimal('12.50'), link='https://example.com/curry',
+            description='Line one\nLine two')
+        # added out of id order, listed by id either way
+        full.tags.add(tags[2], tags[0])
+        full.ingredients.add(*ingredients)
+        tagged = Recipe.objects.create(
+            user=self.user, title='Tagged', time_minutes=1,
+            price=Decimal('0.99'))
+        tagged.tags.add(tags[1])
+        Recipe.objects.filter(pk=full.pk).update(
+            image='uploads/recipe/ab/cd/abcd.jpg',
+            image_renditions=renditions('abcd'))
+        self.ids = [plain.pk, full.pk, tagged.pk]
+
+    def _render(self, serializer_class, context):
+        # return the serializer and the row rendering as JSON
+        recipes = Recipe.objects.filter(
+            pk__in=self.ids).order_by('id').with_attrs()
+        expected = serializer_class(recipes, many=True, context=context).data
+        rows = Recipe.objects.filter(pk__in=self.ids).order_by('id').values(
+            *recipe_columns(serializer_class))
+        actual = represent_recipes(rows, serializer_class, context)
+        return JSONRenderer().render(expected), JSONRenderer().render(actual)
+
+    def test_parity(self):
+        """Test rows render to the same JSON bytes as the serializers"""
+        request = Request(APIRequestFactory().get('/api/recipe/recipes/'))
+        for serializer_class in (RecipeSerializer, RecipeDetailSerializer):
+            for context in ({}, {'request': request}):
+                with self.subTest(serializer_class.__name__,
+                                  request='request' in context):
+                    expected, actual = self._render(serializer_class, context)
+                    self.assertEqual(actual, expected)
+
+    def test_queries(self):
+        """Test attributes are read with one query per kind"""
+        rows = Recipe.objects.filter(pk__in=self.ids).values(
+            *recipe_columns(RecipeDetailSerializer))
+
+        with CaptureQueriesContext(connection) as ctx:
+            represent_recipes(rows, RecipeDetailSerializer, {})
+
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+    def test_no_rows(self):
+        """Test no attribute query is needed without rows"""
+        with self.assertNumQueries(0):
+            data = represent_recipes([], RecipeSerializer, {})
+
+        self.assertEqual(data, [])
+
+
+@tag('benchmark')
+class RecipeRepresentationBenchmark(TestCase):
+    """Compare per recipe rendering time of serializers and rows"""
+
+    recipe_count = 2000
+    attrs_per_recipe = 4
+    runs = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        tags = Tag.objects.bulk_create([
+            Tag(user=user, name=f'Tag {i}') for i in range(50)])
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(user=user, name=f'Ingredient {i}') for i in range(50)])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=i % 120,
+                   price=Decimal('4.20'), description='Mix and bake.',
+                   link='https://example.com/recipe',
+                   image=f'uploads/recipe/{i:064x}.jpg',
+                   image_renditions=renditions(f'{i:064x}'))
+            for i in range(cls.recipe_count)
+        ])
+        for related, attrs in ((Recipe.tags, tags),
+                               (Recipe.ingredients, ingredients)):
+            target = related.field.m2m_reverse_field_name() + '_id'
+            related.through.objects.bulk_create([
+                related.through(**{
+                    'recipe_id': recipe.pk,
+                    target: attrs[(i + offset) % len(attrs)].pk})
+                for i, recipe in enumerate(recipes)
+                for offset in range(cls.attrs_per_recipe)
+            ])
+
+    def setUp(self):
+        self.request = Request(APIRequestFactory().get('/api/recipe/recipes/'))
+
+    def _measure(self, render):
+        # return the best microseconds per recipe to read and render all
+        best = float('inf')
+        for _ in range(self.runs):
+            start = time.perf_counter()
+            content = JSONRenderer().render(render())
+            best = min(best, time.perf_counter() - start)
+        return best / self.recipe_count * 1e6, content
+
+    def test_detail_rendering(self):
+        """benchmark rendering recipes with images, tags and ingredients"""
+        context = {'request': self.request}
+        recipes = Recipe.objects.order_by('id')
+
+        before, expected = self._measure(lambda: RecipeDetailSerializer(
+            recipes.defer('search_vector').with_attrs(), many=True,
+            context=context).data)
+        after, actual = self._measure(lambda: represent_recipes(
+            recipes.values(*recipe_columns(RecipeDetailSerializer)),
+            RecipeDetailSerializer, context))
+
+        sys.stderr.write(
+            f'\nrendering {self.recipe_count} recipes: '
+            f'{before:.1f}us per recipe with serializers, '
+            f'{after:.1f}us from rows\n')
+        self.assertEqual(actual, expected)
+        self.assertLess(after, before / 2)
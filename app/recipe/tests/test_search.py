@@ -0,0 +1,231 @@
+"""
+Tests for full-text search of recipes.
+"""
+import sys
+import time
+from decimal import Decimal
+from unittest import skipUnless
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.models import Recipe, Tag, Ingredient
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.00'),
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSearchTests(TestCase):
+    """Test the search query parameter of the recipe list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def _search(self, search, **params):
+        # return the ids of recipes matching a search, in result order
+        res = self.client.get(RECIPES_URL, {'search': search, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def test_search_title_stemmed(self):
+        """test searching matches stemmed words of the title"""
+        curry = create_recipe(self.user, title='Thai vegetable curry')
+        create_recipe(self.user, title='Fish and chips')
+
+        self.assertEqual(self._search('curries'), [curry.id])
+
+    def test_search_tags_and_ingredients(self):
+        """test searching matches tag and ingredient names"""
+        tagged = create_recipe(self.user, title='Salad')
+        tagged.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        cooked = create_recipe(self.user, title='Stew')
+        cooked.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Paprika'))
+
+        self.assertEqual(self._search('vegan'), [tagged.id])
+        self.assertEqual(self._search('paprika'), [cooked.id])
+
+    def test_search_ranks_title_first(self):
+        """test title matches rank above description matches"""
+        described = create_recipe(
+            self.user, title='Stew', description='Hearty lentil stew')
+        titled = create_recipe(self.user, title='Lentil soup')
+
+        self.assertEqual(self._search('lentil'), [titled.id, described.id])
+
+    def test_search_follows_changes(self):
+        """test renaming and removing tags updates search results"""
+        recipe = create_recipe(self.user, title='Salad')
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(vegan)
+        vegan.name = 'Vegetarian'
+        vegan.save()
+
+        self.assertEqual(self._search('vegan'), [])
+        self.assertEqual(self._search('vegetarian'), [recipe.id])
+
+        self.client.delete(reverse('recipe:tag-detail', args=[vegan.id]))
+        self.assertEqual(self._search('vegetarian'), [])
+
+    def test_search_websearch_syntax(self):
+        """test quoted phrases and excluded words"""
+        soup = create_recipe(self.user, title='Tomato soup')
+        create_recipe(self.user, title='Tomato and basil salad')
+
+        self.assertEqual(self._search('tomato -salad'), [soup.id])
+        self.assertEqual(self._search('"tomato soup"'), [soup.id])
+
+    def test_search_with_tag_filter(self):
+        """test search combines with the tags filter"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        matching = create_recipe(self.user, title='Bean chili')
+        matching.tags.add(vegan)
+        create_recipe(self.user, title='Beef chili')
+
+        self.assertEqual(
+            self._search('chili', tags=str(vegan.id)), [matching.id])
+
+    def test_search_paginated(self):
+        """test following next links returns each match exactly once"""
+        recipes = [
+            create_recipe(self.user, title='Curry ' + 'curry ' * i)
+            for i in range(4)
+        ]
+        recipes.append(create_recipe(self.user, title='Another curry'))
+
+        ids = []
+        res = self.client.get(RECIPES_URL, {'search': 'curry', 'page_size': 2})
+        while True:
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(sorted(ids), sorted(recipe.id for recipe in recipes))
+        self.assertEqual(ids[0], recipes[-2].id)
+
+    def test_bulk_created_recipes_searchable(self):
+        """test recipes created in bulk are indexed"""
+        payload = [
+            {'title': 'Banana bread', 'time_minutes': 60, 'price': '2.00'},
+            {'title': 'Plain toast', 'time_minutes': 2, 'price': '0.50',
+             'tags': [{'name': 'Banana'}]},
+        ]
+        self.client.post(reverse('recipe:recipe-bulk-create'), payload,
+                         format='json')
+
+        self.assertEqual(len(self._search('banana')), 2)
+
+    def test_search_limited_to_user(self):
+        """test searching never returns other users' recipes"""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        create_recipe(other, title='Secret curry')
+
+        self.assertEqual(self._search('curry'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans need Postgres')
+    def test_search_uses_gin_index(self):
+        """test a selective search is answered from the GIN index"""
+        Recipe.objects.bulk_create([
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=5,
+                   price=Decimal('1.00'))
+            for i in range(5000)
+        ])
+        create_recipe(self.user, title='Curry')
+        Recipe.objects.update_search_vector()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(RECIPES_URL, {'search': 'curry'})
+        sql = next(
+            query['sql'] for query in ctx.captured_queries
+            if '@@' in query['sql'])
+
+        with connection.cursor() as cursor:
+            # flush entries left by earlier tests, as autovacuum would
+            cursor.execute("SELECT gin_clean_pending_list('recipe_search_idx')")
+            cursor.execute(f'ANALYZE {Recipe._meta.db_table}')
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('recipe_search_idx', plan)
+
+
+@tag('benchmark')
+@skipUnless(connection.vendor == 'postgresql', 'full-text search needs Postgres')
+class RecipeSearchBenchmark(TransactionTestCase):
+    """Measure search latency for a user with 100k recipes"""
+
+    recipe_count = 100000
+    runs = 50
+    words = [
+        'chicken', 'lentil', 'tomato', 'basil', 'garlic', 'lemon', 'rice',
+        'noodle', 'curry', 'salmon', 'mushroom', 'spinach', 'chickpea',
+        'coconut', 'ginger', 'pepper', 'potato', 'cheese', 'pasta', 'bean',
+    ]
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        words = self.words
+        Recipe.objects.bulk_create([
+            Recipe(
+                user=self.user,
+                title=f'{words[i % 20]} {words[i // 20 % 20]} {i}',
+                description=f'With {words[i // 400 % 20]} and '
+                            f'{words[i // 8000 % 20]}',
+                time_minutes=i % 120,
+                price=Decimal('1.00'),
+            )
+            for i in range(self.recipe_count)
+        ], batch_size=5000)
+        Recipe.objects.filter(user=self.user).update_search_vector()
+        # reclaim the rows replaced by the update, as autovacuum would
+        with connection.cursor() as cursor:
+            cursor.execute(f'VACUUM ANALYZE {Recipe._meta.db_table}')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _p95(self, timings):
+        # return the 95th percentile of timings in milliseconds
+        timings = sorted(timings)
+        return timings[int(len(timings) * 0.95) - 1] * 1000
+
+    def test_search_p95(self):
+        """benchmark common, combined, phrase and rare searches"""
+        searches = ['chicken', 'lentil curry', '"tomato basil"', '12345']
+        queries = []
+        requests = []
+        for i in range(self.runs):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                res = self.client.get(
+                    RECIPES_URL, {'search': searches[i % len(searches)]})
+                requests.append(time.perf_counter() - start)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            queries.extend(
+                float(query['time']) for query in ctx.captured_queries
+                if '@@' in query['sql'])
+
+        sys.stderr.write(
+            f'\nsearch p95 over {self.runs} requests: '
+            f'{self._p95(queries):.1f}ms ranked query, '
+            f'{self._p95(requests):.1f}ms end to end\n')
+        self.assertLess(self._p95(queries), 20)
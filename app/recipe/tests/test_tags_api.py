@@ -55,7 +55,7 @@ class PrivateTagsApiTests(TestCase):
         serializer = TagSerializer(tags, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         # test that tags returned are for the authenticated user
@@ -66,9 +66,9 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
-        self.assertEqual(res.data[0]['id'], tag.id)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
 
     def test_update_tag(self):
         # test updating a new tag
@@ -82,6 +82,17 @@ class PrivateTagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_rename_tag_to_existing_name(self):
+        """test renaming a tag to a name already in use fails"""
+        Tag.objects.create(user=self.user, name='Dinner')
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Dinner'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Breakfast')
+
     def test_delete_tag(self):
         # test deleting a tag
         tag = Tag.objects.create(user=self.user, name='Breakfast')
@@ -109,8 +120,8 @@ class PrivateTagsApiTests(TestCase):
 
         s1 = TagSerializer(tag1)
         s2 = TagSerializer(tag2)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_tags_uniqe(self):
         """ test filtered tags returns a unique list"""
@@ -133,4 +144,31 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_order_tags_by_recipe_count(self):
+        """test ordering tags by the number of recipes, most used first"""
+        names = ['Lunch', 'Breakfast', 'Dinner', 'Brunch']
+        tags = [Tag.objects.create(user=self.user, name=name) for name in names]
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price=Decimal('1.00'))
+            recipe.tags.add(*tags[:i + 1])
+
+        seen = []
+        res = self.client.get(
+            TAGS_URL, {'ordering': '-recipe_count', 'page_size': 1})
+        while True:
+            seen.extend(tag['name'] for tag in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(seen, ['Lunch', 'Breakfast', 'Dinner', 'Brunch'])
+
+    def test_invalid_ordering(self):
+        """test ordering by an unsupported field is rejected"""
+        res = self.client.get(TAGS_URL, {'ordering': 'user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
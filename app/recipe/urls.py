@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register('recipes', views.RecipeViewSet)
 router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
+router.register('jobs', views.JobViewSet)
 
 app_name = 'recipe'
 
@@ -1,56 +1,143 @@
 # Views for the recipe APIs
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.core.files.storage import default_storage
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import generics, viewsets, mixins, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import _positive_int
 from rest_framework.response import Response
 
-from core.models import Recipe, Tag, Ingredient
+from core.models import Job, Recipe, Tag, Ingredient
+from core.authentication import CachedTokenAuthentication
+from core.cache import (
+    VersionedCacheMixin,
+    bump_user_version,
+    get_user_modified,
+    get_user_version,
+)
+from core.images import RENDITION_FORMATS, render_recipe_image
+from core.jobs import enqueue
+from core.media import media_response, media_version
+from core.uploads import ImageUploadHandler
+from core.renderers import NDJSONRenderer
 from recipe import serializers
+from recipe.exports import export_lines
+from recipe.filters import filter_recipes
+from recipe.pagination import KeysetPagination
+from recipe.representations import recipe_columns, represent_recipes
 
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, OpenApiTypes
 
 
+RECIPE_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        'tags',
+        OpenApiTypes.STR,
+        description='Comma separated list of Ids to filter'),
+    OpenApiParameter(
+        'ingredients',
+        OpenApiTypes.STR,
+        description='Comma separated list of ingredient IDs to filter'),
+    OpenApiParameter(
+        'search',
+        OpenApiTypes.STR,
+        description='Full-text search over titles, descriptions, tags and '
+                    'ingredients; results are ordered by relevance'),
+    OpenApiParameter(
+        'match',
+        OpenApiTypes.STR, enum=['any', 'all'],
+        description='Match recipes with any (default) or all of the IDs'),
+]
+
+RECIPE_FACETS = ('tags', 'ingredients')
+
+RECIPE_IMAGE_PARAMETERS = [
+    OpenApiParameter(
+        'size',
+        OpenApiTypes.STR, enum=list(settings.RECIPE_IMAGE_RENDITIONS),
+        description='Send this rendition instead of the original image'),
+    OpenApiParameter(
+        'image_format',
+        OpenApiTypes.STR, enum=list(RENDITION_FORMATS),
+        description='Format of the rendition, webp by default'),
+    OpenApiParameter(
+        'v',
+        OpenApiTypes.STR,
+        description='Version of the file, as in the image URLs of recipes; '
+                    'a current version lets clients keep the file'),
+]
+
+
+class RecipePagination(KeysetPagination):
+    # recipe lists may count facets over every matching recipe
+    facets = RECIPE_FACETS
+
+
+def recipe_etag(request, rows, *extra):
+    """Return a strong ETag for (id, updated_at) rows of a response."""
+    digest = hashlib.sha1(request.accepted_renderer.format.encode())
+    for pk, updated_at in rows:
+        digest.update(f'{pk}:{updated_at.isoformat()};'.encode())
+    for value in extra:
+        digest.update(f'{value};'.encode())
+    return f'"{digest.hexdigest()}"'
+
+
 @extend_schema_view(
-    list=extend_schema(
-        parameters=[
-            OpenApiParameter(
-                'tags',
-                OpenApiTypes.STR,
-                description='Comma separated list of Ids to filter'),
-            OpenApiParameter(
-                'ingredients',
-                OpenApiTypes.STR,
-                description='Comma separated list of ingredient IDs to filter'),
-        ]
-    )
+    list=extend_schema(parameters=RECIPE_FILTER_PARAMETERS + [
+        OpenApiParameter(
+            'facets',
+            OpenApiTypes.STR,
+            description='Comma separated list of facets (tags, ingredients) '
+                        'to count over every matching recipe; the counts '
+                        'are returned under the facets key'),
+    ]),
+    export=extend_schema(parameters=RECIPE_FILTER_PARAMETERS),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(VersionedCacheMixin, viewsets.ModelViewSet):
     # View for manage recipe APIs
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipePagination
+    keyset_ordering = ('-id',)
 
-    def _params_to_ints(self, qs):
-        """Convert a list of strings to integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+    def get_keyset_ordering(self):
+        # search results are ordered by relevance before recency
+        if self.request.query_params.get('search'):
+            return ('-rank', '-id')
+        return self.keyset_ordering
 
     def get_queryset(self):
         # retrieve recipes for authenticated user
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        queryset = self.queryset.filter(
+            user=self.request.user).defer('search_vector')
+        if self.action == 'image':
+            return queryset.only('id', 'image', 'image_renditions')
+        queryset = filter_recipes(queryset, self.request.query_params)
+        return queryset.order_by('-id').with_attrs()
 
-        return queryset.filter(user=self.request.user).order_by('-id').distinct()
+    def _get_facets(self):
+        """Return the requested facet names, rejecting unknown ones"""
+        facets = self.request.query_params.get('facets')
+        if not facets:
+            return []
+        names = list(dict.fromkeys(
+            name.strip() for name in facets.split(',') if name.strip()))
+        unknown = [name for name in names if name not in RECIPE_FACETS]
+        if unknown:
+            raise ValidationError(
+                {'facets': f'Unknown facets: {", ".join(unknown)}.'})
+        return names
 
     def get_serializer_class(self):
         # return the serializer class for request
@@ -61,56 +148,327 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class
 
+    def _conditional_response(self, request, etag, last_modified,
+                              handler, *args, **kwargs):
+        # answer 304 when the client copy is current, else call the handler
+        last_modified = int(last_modified)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(*args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        # validate the page from ids and timestamps before serializing it
+        facets = self._get_facets()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(
+            queryset.prefetch_related(None).only('id', 'updated_at'))
+        # facets cover recipes off the page, so any write invalidates them
+        etag = recipe_etag(
+            request,
+            [(recipe.pk, recipe.updated_at) for recipe in page],
+            self.paginator.get_next_link(),
+            self.paginator.get_previous_link(),
+            *([','.join(facets), get_user_version(request.user)]
+              if facets else []),
+        )
+        timestamps = [recipe.updated_at.timestamp() for recipe in page]
+        last_modified = max(timestamps + [get_user_modified(request.user)])
+        return self._conditional_response(
+            request, etag, last_modified,
+            self.cached_response, self._list_page, request, page,
+            queryset, facets, validator=etag,
+        )
+
+    def _list_page(self, request, page, queryset, facets):
+        # render the full recipes of a page from rows, then count facets
+        serializer_class = self.get_serializer_class()
+        rows = Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in page],
+        ).values(*recipe_columns(serializer_class))
+        recipes = {
+            recipe['id']: recipe for recipe in represent_recipes(
+                rows, serializer_class, self.get_serializer_context())
+        }
+        response = self.get_paginated_response(
+            [recipes[recipe.pk] for recipe in page])
+        if facets:
+            response.data['facets'] = {
+                name: queryset.facet_counts(name) for name in facets
+            }
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        updated_at = generics.get_object_or_404(
+            self.get_queryset().values_list('updated_at', flat=True),
+            **{self.lookup_field: lookup},
+        )
+        etag = recipe_etag(request, [(lookup, updated_at)])
+        return self._conditional_response(
+            request, etag, updated_at.timestamp(),
+            self.cached_response, super().retrieve, request, *args,
+            validator=etag, **kwargs,
+        )
+
     def perform_create(self, serializer):
         # create a new recipe
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        # delete a recipe and invalidate cached responses
+        instance.delete()
+        bump_user_version(self.request.user)
+
+    @extend_schema(
+        request=serializers.RecipeDetailSerializer(many=True),
+        responses={201: serializers.RecipeDetailSerializer(many=True)},
+    )
+    @action(methods=['POST'], detail=False, url_path='bulk',
+            pagination_class=None)
+    def bulk_create(self, request):
+        """create many recipes in a single transaction"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save(user=request.user)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(methods=['GET'], detail=False, renderer_classes=[NDJSONRenderer])
+    def export(self, request):
+        """stream every matching recipe as newline-delimited JSON"""
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            export_lines(queryset, self.get_serializer_context()),
+            content_type=NDJSONRenderer.media_type,
+        )
+        response['Content-Disposition'] = 'attachment; filename="recipes.ndjson"'
+        return response
+
+    @extend_schema(
+        parameters=RECIPE_FILTER_PARAMETERS,
+        request=None,
+        responses={202: serializers.JobSerializer},
+    )
+    @action(methods=['POST'], detail=False, url_path='export/background')
+    def export_background(self, request):
+        """write every matching recipe to a file in a background job"""
+        params = {
+            name: request.query_params[name]
+            for name in ('tags', 'ingredients', 'search', 'match')
+            if name in request.query_params
+        }
+        job = enqueue(
+            'export_recipes', user=request.user,
+            user_id=request.user.pk, params=params)
+        return Response(
+            serializers.JobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        parameters=RECIPE_IMAGE_PARAMETERS,
+        responses={200: OpenApiTypes.BINARY},
+    )
+    @action(methods=['GET'], detail=True)
+    def image(self, request, pk=None):
+        """send the recipe image, or one of its renditions"""
+        recipe = self.get_object()
+        size = request.query_params.get('size')
+        image_format = request.query_params.get('image_format', 'webp')
+        if size is not None and size not in settings.RECIPE_IMAGE_RENDITIONS:
+            raise ValidationError({'size': f'Unknown size {size}.'})
+        if image_format not in RENDITION_FORMATS:
+            raise ValidationError(
+                {'image_format': f'Unknown format {image_format}.'})
+        if size is None:
+            name = recipe.image.name
+        else:
+            # renditions appear once the upload was processed
+            name = recipe.image_renditions.get(size, {}).get(image_format)
+        if not name:
+            raise Http404
+        # a stale version still gets the current file, but not for keeps
+        immutable = request.query_params.get('v') == media_version(name)
+        return media_response(
+            request, recipe.image.storage, name, immutable=immutable)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """ upload an image to a recipe"""
+        # stream the upload to disk, refusing it as soon as it is no image
+        request.upload_handlers = [ImageUploadHandler(request)]
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            # renditions of a replaced image no longer apply
+            serializer.save(image_renditions={})
+            bump_user_version(request.user)
+            if settings.RECIPE_IMAGE_RENDITIONS_ASYNC:
+                # answer now; renditions appear once a worker made them
+                job = enqueue(
+                    'render_recipe_image', user=request.user,
+                    recipe_id=recipe.pk, image=recipe.image.name)
+                return Response(
+                    {**serializer.data,
+                     'job': serializers.JobSerializer(job).data},
+                    status=status.HTTP_202_ACCEPTED)
+            render_recipe_image(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+RECIPE_ATTR_AUTOCOMPLETE_PARAMETERS = [
+    OpenApiParameter(
+        'q',
+        OpenApiTypes.STR,
+        description='Suggest names similar to or containing this text'),
+    OpenApiParameter(
+        'prefix',
+        OpenApiTypes.STR,
+        description='Suggest names starting with this text (case sensitive)'),
+    OpenApiParameter(
+        'limit',
+        OpenApiTypes.INT,
+        description='Number of suggestions to return, at most '
+                    f'{settings.RECIPE_AUTOCOMPLETE_MAX_LIMIT}'),
+]
+
+
+# keyset orderings for recipe attributes; names are unique per user
+RECIPE_ATTR_ORDERINGS = {
+    '-name': ('-name',),
+    '-recipe_count': ('-recipe_count', 'name'),
+}
+
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
             OpenApiParameter(
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
-                description='Filter only assigned objects')
+                description='Filter only assigned objects'),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR, enum=list(RECIPE_ATTR_ORDERINGS),
+                description='Order by name (default) or by the number of '
+                            'recipes using each object, most used first'),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.DestroyModelMixin, mixins.UpdateModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+class BaseRecipeAttrViewSet(VersionedCacheMixin, mixins.DestroyModelMixin, mixins.UpdateModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
     """base viewset for recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    keyset_ordering = RECIPE_ATTR_ORDERINGS['-name']
+
+    def get_keyset_ordering(self):
+        # order by the requested keyset, rejecting unknown orderings
+        ordering = self.request.query_params.get('ordering', '-name')
+        if ordering not in RECIPE_ATTR_ORDERINGS:
+            raise ValidationError(
+                {'ordering': f'Must be one of: '
+                             f'{", ".join(RECIPE_ATTR_ORDERINGS)}.'})
+        return RECIPE_ATTR_ORDERINGS[ordering]
 
     def get_queryset(self):
         # return objects for the authenticated user
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
-        queryset = self.queryset
+        queryset = self.queryset.filter(user=self.request.user)
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+            queryset = queryset.assigned()
+        return queryset.order_by(*self.get_keyset_ordering())
+
+    @action(methods=['GET'], detail=False, pagination_class=None)
+    def autocomplete(self, request):
+        """suggest names for the q or prefix typed so far"""
+        return self.cached_response(self._autocomplete, request)
+
+    def _autocomplete(self, request):
+        # return the best suggestions for the request parameters
+        q = request.query_params.get('q', '').strip()
+        prefix = request.query_params.get('prefix', '')
+        if not q and not prefix:
+            raise ValidationError({'q': 'Provide q or prefix.'})
+        try:
+            limit = _positive_int(
+                request.query_params.get(
+                    'limit', settings.RECIPE_AUTOCOMPLETE_LIMIT),
+                strict=True,
+                cutoff=settings.RECIPE_AUTOCOMPLETE_MAX_LIMIT,
+            )
+        except ValueError:
+            raise ValidationError({'limit': 'Must be a positive integer.'})
+
+        suggestions = self.queryset.filter(
+            user=request.user).suggest(q=q, prefix=prefix)[:limit]
+        serializer = self.get_serializer(suggestions, many=True)
+        return Response(serializer.data)
 
+    def perform_update(self, serializer):
+        # update the object and invalidate cached responses
+        serializer.save()
+        bump_user_version(self.request.user)
 
+    def perform_destroy(self, instance):
+        # delete the object and invalidate cached responses
+        instance.delete()
+        bump_user_version(self.request.user)
+
+
+@extend_schema_view(
+    autocomplete=extend_schema(
+        parameters=RECIPE_ATTR_AUTOCOMPLETE_PARAMETERS,
+        responses=serializers.TagSerializer(many=True),
+    )
+)
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
 
 
+@extend_schema_view(
+    autocomplete=extend_schema(
+        parameters=RECIPE_ATTR_AUTOCOMPLETE_PARAMETERS,
+        responses=serializers.IngredientSerializer(many=True),
+    )
+)
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database"""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Check on background jobs"""
+    serializer_class = serializers.JobSerializer
+    queryset = Job.objects.all()
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        # only the jobs queued by the authenticated user
+        return self.queryset.filter(user=self.request.user)
+
+    @extend_schema(responses={200: OpenApiTypes.BINARY})
+    @action(methods=['GET'], detail=True)
+    def download(self, request, pk=None):
+        """download the file written by a finished job, such as an export"""
+        job = self.get_object()
+        name = job.result.get('file')
+        if job.status != Job.DONE or not name:
+            raise Http404
+        return media_response(
+            request, default_storage, name,
+            filename=f'{job.name}.{name.rsplit(".", 1)[-1]}')
@@ -1,10 +1,31 @@
 server {
     listen ${LISTEN_PORT};
 
+    sendfile                on;
+    tcp_nopush              on;
+    open_file_cache         max=10000 inactive=5m;
+    open_file_cache_valid   1m;
+
     location /static {
         alias /vol/static;
     }
 
+    # uploads and exports are only sent to their owner, through
+    # /internal-media, with the cache headers the app chose
+    location ^~ /static/media/uploads/ {
+        return 404;
+    }
+
+    location ^~ /static/media/exports/ {
+        return 404;
+    }
+
+    # files the app checked access to, sent with X-Accel-Redirect
+    location /internal-media/ {
+        internal;
+        alias /vol/static/media/;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;